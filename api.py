@@ -0,0 +1,244 @@
+# -*- coding: utf-8 -*-
+"""JSON API для мобильного клиента: /api/v1.
+
+Те же запросы, что и у HTML-страниц (search_index, chat), без рендера шаблонов.
+Авторизация — обычной сессией (cookie после /login). Общие соглашения:
+
+* ``fields=id,nickname,avatar`` — вернуть только нужные поля пользователя;
+  профили ученика/специалиста подгружаются, только если их поля запрошены;
+* ``GET /users?ids=1,2,3`` — до ``API_MAX_BATCH`` пользователей за один запрос;
+* списки отдаются как ``{"items": [...], "next_cursor": ...}``; курсор непрозрачен,
+  его нужно передать в ``cursor`` для следующей страницы;
+* ответы больше ``API_COMPRESS_MIN_SIZE`` сжимаются gzip или brotli (если
+  установлен пакет ``brotli`` и клиент прислал ``Accept-Encoding: br``).
+"""
+import gzip
+from functools import wraps
+
+from flask import Blueprint, current_app, jsonify, request, session, url_for
+from sqlalchemy.orm import selectinload
+from werkzeug.exceptions import HTTPException
+
+try:
+    import brotli
+except ImportError:  # сжатие brotli необязательно
+    brotli = None
+
+import chat
+import search_index
+from chat import ConvHelper
+from images import avatar_url
+from models import db, User, Conversation, ConversationMember
+
+bp = Blueprint("api", __name__, url_prefix="/api/v1")
+
+# поле -> (функция от User, нужен ли профиль ученика/специалиста)
+USER_FIELDS = {
+    "id": (lambda u: u.id, False),
+    "nickname": (lambda u: u.nickname, False),
+    "first_name": (lambda u: u.first_name, False),
+    "last_name": (lambda u: u.last_name, False),
+    "role": (lambda u: u.role, False),
+    "avatar": (lambda u: {"sm": avatar_url(u, "sm"), "md": avatar_url(u, "md")}, False),
+    "age": (lambda u: u.age, False),
+    "education": (lambda u: u.education, False),
+    "graduation_year": (lambda u: u.graduation_year, False),
+    "course_image": (lambda u: u.course_image, False),
+    "follower_count": (lambda u: u.follower_count, False),
+    "url": (lambda u: url_for("public_profile", user_id=u.id), False),
+    "keywords": (lambda u: u.specialist.keywords if u.specialist else None, True),
+    "looking_for": (lambda u: u.student.looking_for if u.student else None, True),
+}
+DEFAULT_USER_FIELDS = ("id", "nickname", "first_name", "last_name", "role", "avatar")
+
+
+class ApiError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def api_login_required(f):
+    @wraps(f)
+    def w(*args, **kwargs):
+        if not session.get("user_id"):
+            raise ApiError("authentication required", 401)
+        return f(*args, **kwargs)
+    return w
+
+
+def requested_fields():
+    raw = request.args.get("fields")
+    if not raw:
+        return DEFAULT_USER_FIELDS
+    fields = tuple(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in USER_FIELDS]
+    if unknown:
+        raise ApiError(f"unknown fields: {', '.join(unknown)}")
+    return fields
+
+
+def needs_profiles(fields):
+    return any(USER_FIELDS[f][1] for f in fields)
+
+
+def user_json(u, fields):
+    return {f: USER_FIELDS[f][0](u) for f in fields}
+
+
+def _int_list(raw, name):
+    try:
+        return [int(x) for x in (raw or "").split(",") if x.strip()]
+    except ValueError:
+        raise ApiError(f"{name} must be a comma-separated list of integers")
+
+
+# ---------- Люди ----------
+@bp.route("/search")
+@api_login_required
+def search():
+    fields = requested_fields()
+    page = max(request.args.get("cursor", 1, type=int) or 1, 1)
+    people, has_next = search_index.search_people(request.args.get("q", ""), page)
+    return jsonify(items=[user_json(p, fields) for p in people], next_cursor=str(page + 1) if has_next else None)
+
+
+@bp.route("/users")
+@api_login_required
+def users_batch():
+    fields = requested_fields()
+    ids = _int_list(request.args.get("ids"), "ids")
+    if not ids:
+        raise ApiError("ids is required")
+    if len(ids) > current_app.config["API_MAX_BATCH"]:
+        raise ApiError(f"at most {current_app.config['API_MAX_BATCH']} ids per request")
+    q = User.query.filter(User.id.in_(ids))
+    if needs_profiles(fields):
+        q = q.options(selectinload(User.student), selectinload(User.specialist))
+    by_id = {u.id: u for u in q}
+    # порядок как в запросе; отсутствующие id просто пропускаются
+    return jsonify(items=[user_json(by_id[i], fields) for i in dict.fromkeys(ids) if i in by_id])
+
+
+@bp.route("/users/<int:user_id>")
+@api_login_required
+def user_detail(user_id):
+    fields = requested_fields()
+    q = User.query.filter(User.id == user_id)
+    if needs_profiles(fields):
+        q = q.options(selectinload(User.student), selectinload(User.specialist))
+    u = q.first()
+    if not u:
+        raise ApiError("user not found", 404)
+    return jsonify(user_json(u, fields))
+
+
+# ---------- Диалоги ----------
+def _membership(conversation_id, user_id):
+    if not ConversationMember.query.filter_by(conversation_id=conversation_id, user_id=user_id).first():
+        raise ApiError("conversation not found", 404)
+
+
+@bp.route("/conversations")
+@api_login_required
+def conversations():
+    fields = requested_fields()
+    me = session["user_id"]
+    convs, next_cursor = chat.list_conversations(me, request.args.get("cursor"))
+    if convs and needs_profiles(fields):
+        # собеседники уже в identity map — догружаем им профили одним запросом на тип
+        (User.query.options(selectinload(User.student), selectinload(User.specialist))
+         .filter(User.id.in_([c["other"].id for c in convs])).all())
+    return jsonify(items=[{
+        "id": c["id"],
+        "other": user_json(c["other"], fields),
+        "last": chat.message_json(c["last"], me) if c["last"] else None,
+        "unread": c["unread"],
+    } for c in convs], next_cursor=next_cursor)
+
+
+@bp.route("/conversations/with/<int:user_id>", methods=["POST"])
+@api_login_required
+def open_conversation(user_id):
+    """Найти или создать личный диалог с пользователем; возвращает его id."""
+    me = session["user_id"]
+    if me == user_id or not User.query.filter_by(id=user_id).first():
+        raise ApiError("user not found", 404)
+    return jsonify(id=ConvHelper.get_or_create(me, user_id).id)
+
+
+@bp.route("/conversations/<int:conversation_id>/messages", methods=["GET", "POST"])
+@api_login_required
+def messages(conversation_id):
+    """GET: ``cursor`` — страница старее, ``after`` — страница новее (id сообщения). POST: {"text": ...}.
+
+    ``next_cursor`` — id для следующей страницы в ту же сторону: передавать в ``cursor``
+    или, при чтении по ``after``, снова в ``after``.
+    """
+    me = session["user_id"]
+    _membership(conversation_id, me)
+    if request.method == "POST":
+        text_ = ((request.get_json(silent=True) or {}).get("text") or "").strip()
+        if not text_:
+            raise ApiError("text is required")
+        conv = db.session.get(Conversation, conversation_id)
+        return jsonify(chat.message_json(chat.post_message(conv, me, text_), me)), 201
+    after = request.args.get("after", type=int)
+    if after is not None:
+        msgs, has_more = chat.messages_after(conversation_id, after)
+        edge = msgs[-1] if msgs else None
+    else:
+        msgs, has_more = chat.history(conversation_id, request.args.get("cursor", type=int))
+        edge = msgs[0] if msgs else None
+    return jsonify(items=[chat.message_json(m, me) for m in msgs],
+                   next_cursor=str(edge.id) if has_more and edge else None)
+
+
+# ---------- Ошибки и сжатие ----------
+@bp.errorhandler(ApiError)
+def _api_error(e):
+    return jsonify(error=e.message), e.status
+
+
+@bp.errorhandler(HTTPException)
+def _http_error(e):
+    return jsonify(error=e.description), e.code
+
+
+@bp.after_request
+def _compress(resp):
+    cfg = current_app.config
+    if (resp.direct_passthrough or resp.status_code < 200 or resp.status_code >= 300
+            or "Content-Encoding" in resp.headers or not resp.is_json):
+        return resp
+    data = resp.get_data()
+    if len(data) < cfg["API_COMPRESS_MIN_SIZE"]:
+        return resp
+    accepted = request.accept_encodings
+    if brotli is not None and accepted["br"]:
+        resp.set_data(brotli.compress(data, quality=cfg["API_BROTLI_QUALITY"]))
+        resp.headers["Content-Encoding"] = "br"
+    elif accepted["gzip"]:
+        resp.set_data(gzip.compress(data, compresslevel=cfg["API_GZIP_LEVEL"]))
+        resp.headers["Content-Encoding"] = "gzip"
+    else:
+        return resp
+    resp.vary.add("Accept-Encoding")
+    return resp
+
+
+def init_app(app):
+    app.config.setdefault("API_MAX_BATCH", 100)
+    app.config.setdefault("API_COMPRESS_MIN_SIZE", 1024)
+    app.config.setdefault("API_GZIP_LEVEL", 6)
+    app.config.setdefault("API_BROTLI_QUALITY", 5)
+    app.register_blueprint(bp)
+
+    @app.errorhandler(404)
+    @app.errorhandler(405)
+    def _api_not_found(e):
+        # ошибки маршрутизации не доходят до обработчиков blueprint'а
+        if request.path.startswith(bp.url_prefix + "/"):
+            return jsonify(error=e.description), e.code
+        return e
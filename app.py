@@ -1,62 +1,70 @@
 # -*- coding: utf-8 -*-
-import os, datetime, random
-from flask import Flask, render_template, request, redirect, url_for, flash, session, send_from_directory, g
-from flask_sqlalchemy import SQLAlchemy
-from passlib.hash import argon2
-from werkzeug.utils import secure_filename
-
-from sqlalchemy import inspect, text  # SQLAlchemy 2.x: инспектор и text
+import os, datetime, random, queue, time
+from flask import Flask, render_template, request, redirect, url_for, flash, session, g, jsonify, abort, Response, stream_with_context, current_app
+
+from sqlalchemy import inspect
+from sqlalchemy.orm import joinedload
+
+import chat
+import db_config
+import feed as feed_engine
+import i18n
+import instrumentation
+import realtime
+from cache import MemoryCache
+from passwords import passwords, HashingBusy
+from images import images, ImageRejected, avatar_url
+import api
+import assets
+from chat import ConvHelper
+import migrations
+from page_cache import pages
+import search_index
+import seed
+import sessions
+import tags
+from helpers import translit
+from i18n import t
+from models import db, User, StudentProfile, SpecialistProfile
 
 
 BASE_DIR = os.path.abspath(os.path.dirname(__file__))
 UPLOAD_FOLDER = os.path.join(BASE_DIR, "uploads")
-DEFAULT_AVATARS = {
-    "student": "/static/img/lion_student.svg",
-    "specialist": "/static/img/lion_teacher.svg",
-}
 ALLOWED_IMG = {"png","jpg","jpeg","gif","webp"}
+header_cache = MemoryCache(maxsize=10000)
 
-db = SQLAlchemy()
-
-
-def ensure_schema():
-    """Apply simple runtime migrations that are not covered by create_all()."""
-
-    # ``db.engine`` is only available inside an application context, so the
-    # function is expected to be called from there.
-    engine = db.engine
-
-    # ``engine.begin()`` opens a transaction and commits it automatically
-    # which ensures that the DDL executed below is persisted.
-    with engine.begin() as conn:
-        inspector = inspect(conn)
-
-        if "user" not in inspector.get_table_names():
-            return
-
-        column_names = {col["name"] for col in inspector.get_columns("user")}
-        if "age" not in column_names:
-            ddl = text('ALTER TABLE "user" ADD COLUMN age INTEGER')
-            conn.execute(ddl)
-
-RU = {"login_title":"Вход","email":"Email","password":"Пароль","sign_in":"Войти","register":"Зарегистрироваться","feed":"Лента","search":"Поиск","chat":"Чат","notifications":"Уведомления","plan":"Мой план","profile_title":"Профиль","complete_profile":"Заполните профиль","close":"Закрыть","welcome_title":"Добро пожаловать!","tagline":"Найдите своего специалиста!","first_time":"Впервые у нас?","signup":"Зарегистрироваться","submit":"Далее","cancel":"Отмена","name_title":"Расскажите о себе","first_name":"Имя","last_name":"Фамилия","avatar_title":"Аватар","nickname_title":"Придумайте никнейм","suggestions":"Варианты никнейма","university":"ВУЗ"}
-EN = {"login_title":"Sign in","email":"Email","password":"Password","sign_in":"Sign in","register":"Register","feed":"Feed","search":"Search","chat":"Chat","notifications":"Notifications","plan":"My plan","profile_title":"Profile","complete_profile":"Complete your profile","close":"Close","welcome_title":"Welcome!","tagline":"Find your specialist!","first_time":"New here?","signup":"Sign up","submit":"Next","cancel":"Cancel","name_title":"Tell us about you","first_name":"First name","last_name":"Last name","avatar_title":"Avatar","nickname_title":"Choose a nickname","suggestions":"Suggestions","university":"University"}
-def tr(lang, key): return (RU if lang=="ru" else EN).get(key, key)
 
 # ---------- Глобальные утилиты ----------
-def avatar_url(user=None):
-    """Единая точка получения URL аватара (глобальная, доступна во всех view)."""
-    if not user:
-        return DEFAULT_AVATARS["student"]
-    if getattr(user, "avatar", None):
-        return user.avatar
-    return DEFAULT_AVATARS.get(getattr(user, "role", None) or "student", DEFAULT_AVATARS["student"])
-
 def current_user():
+    """Текущий пользователь с профилями; грузится не больше одного раза за запрос."""
+    if "current_user" not in g:
+        uid = session.get("user_id")
+        g.current_user = (User.query.options(joinedload(User.student), joinedload(User.specialist))
+                          .filter(User.id == uid).first() if uid else None)
+    return g.current_user
+
+def current_header():
+    """Данные шапки (аватар, ник) из короткоживущего кэша, без обращения к БД при попадании."""
     uid = session.get("user_id")
-    return User.query.get(uid) if uid else None
-
-def create_app():
+    if not uid:
+        return None
+    data = header_cache.get(uid)
+    if data is None:
+        u = current_user()
+        if not u:
+            return None
+        data = {"avatar": avatar_url(u, "sm"), "nickname": u.nickname or u.email.split("@")[0]}
+        header_cache.set(uid, data, current_app.config["HEADER_CACHE_TTL"])
+    return data
+
+def profile_updated(u):
+    """Вызывается после сохранения профиля: сбрасывает закэшированные данные пользователя."""
+    # identity не требует перезагрузки объекта, истёкшего после commit()
+    uid = inspect(u).identity[0]
+    header_cache.delete(uid)
+    pages.bump("user", uid)
+
+def create_app(config=None):
     app = Flask(__name__, instance_relative_config=True, static_folder="static", template_folder="templates")
     app.config.from_mapping(
         SECRET_KEY="dev",
@@ -67,94 +75,66 @@ def create_app():
         SESSION_COOKIE_HTTPONLY=True,
         SESSION_COOKIE_SAMESITE="Lax",
         SESSION_COOKIE_SECURE=False,
+        MAX_CONTENT_LENGTH=16 * 1024 * 1024,
+        CHAT_STREAM_HEARTBEAT=15,
+        CHAT_STREAM_MAX_AGE=300,
+        CHAT_POLL_TIMEOUT=25,
+        HEADER_CACHE_TTL=60,
+        FEED_FANOUT_LIMIT=5000,
     )
     app.config.from_pyfile("config.py", silent=True)
+    if config:
+        # переопределения поверх instance/config.py — для бенчмарков и отдельных стендов
+        app.config.update(config)
     os.makedirs(app.instance_path, exist_ok=True)
-    os.makedirs(UPLOAD_FOLDER, exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_FOLDER,"avatars"), exist_ok=True)
-    os.makedirs(os.path.join(UPLOAD_FOLDER,"courses"), exist_ok=True)
+    os.makedirs(app.config["UPLOAD_FOLDER"], exist_ok=True)
+    os.makedirs(os.path.join(app.config["UPLOAD_FOLDER"],"avatars"), exist_ok=True)
+    os.makedirs(os.path.join(app.config["UPLOAD_FOLDER"],"courses"), exist_ok=True)
 
+    db_config.configure(app)
     db.init_app(app)
-
-    # Глобальные значения в g и контекст в шаблонах
+    db_config.install_pragmas(app)
+    instrumentation.init_app(app)
+    passwords.init_app(app)
+    images.init_app(app)
+    assets.init_app(app)
+    pages.init_app(app)
+
+    # Язык и тема запроса в g; функции для шаблонов — глобалами Jinja, один раз
+    i18n.init_app(app)
     def _globals():
-        g.lang = session.get("lang", "ru")
+        if request.endpoint in ("static", "uploaded"):
+            return  # файлам язык и тема не нужны — не поднимаем ради них сессию
+        i18n.select(session.get("lang", app.config["DEFAULT_LANGUAGE"]))
         g.theme = session.get("theme", "dark")
-    def inject_i18n():
-        return dict(
-            t=lambda k: tr(g.lang, k),
-            lang=g.lang,
-            theme=g.theme,
-            current_user=current_user,
-            avatar_url=avatar_url,  # функцию тоже пробрасываем в шаблоны
-        )
     app.before_request(_globals)
-    app.context_processor(inject_i18n)
-
-    with app.app_context():
-        db.create_all()
-        ensure_schema()
+    app.jinja_env.globals.update(
+        current_user=current_user,
+        current_header=current_header,
+        avatar_url=avatar_url,  # функцию тоже пробрасываем в шаблоны
+    )
 
+    migrations.init_app(app)
+    sessions.init_app(app)
+    search_index.init_app(app)
+    seed.init_app(app)
+    tags.init_app(app)
     register_routes(app)
+    api.init_app(app)
     return app
 
-# ---------- Модели ----------
-class User(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    email = db.Column(db.String(255), unique=True, nullable=False)
-    password_hash = db.Column(db.String(255), nullable=False)
-    role = db.Column(db.String(20), nullable=False, default="student")
-    age = db.Column(db.Integer)
-    first_name = db.Column(db.String(120))
-    last_name = db.Column(db.String(120))
-    nickname = db.Column(db.String(120), unique=True)
-    avatar = db.Column(db.String(255))
-    age = db.Column(db.Integer)
-    education = db.Column(db.String(255))
-    graduation_year = db.Column(db.String(10))
-    course_image = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-    student = db.relationship("StudentProfile", backref="user", uselist=False, cascade="all, delete-orphan")
-    specialist = db.relationship("SpecialistProfile", backref="user", uselist=False, cascade="all, delete-orphan")
-    posts = db.relationship("Post", backref="user", lazy=True, cascade="all, delete-orphan")
-
-class StudentProfile(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, unique=True)
-    looking_for = db.Column(db.Text)
-
-class SpecialistProfile(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, unique=True)
-    education_degree = db.Column(db.String(120))
-    workplace = db.Column(db.String(255))
-    keywords = db.Column(db.Text)
-
-class Post(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    title = db.Column(db.String(255))
-    summary = db.Column(db.Text)
-    image = db.Column(db.String(255))
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-class Conversation(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
-class ConversationMember(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-
-class Message(db.Model):
-    id = db.Column(db.Integer, primary_key=True)
-    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=False)
-    sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
-    text = db.Column(db.Text, nullable=False)
-    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
-
 # ---------- Хелперы ----------
+def image_saved(field):
+    """Колбэк фоновой обработки: записать URL готового изображения в поле профиля."""
+    def done(user_id, url):
+        u = db.session.get(User, user_id)
+        if u:
+            setattr(u, field, url); db.session.commit(); profile_updated(u)
+    return done
+
+def wants_json():
+    return request.accept_mimetypes.best_match(["text/html", "application/json"]) == "application/json"
+
 def login_required(f):
     from functools import wraps
     @wraps(f)
@@ -164,50 +144,6 @@ def login_required(f):
         return f(*args, **kwargs)
     return w
 
-def ensure_bots():
-    if User.query.filter_by(email="alice@bots.dev").first(): return
-    bots = [
-        ("alice@bots.dev","specialist","Alice","Johnson","alice-tutor",DEFAULT_AVATARS["specialist"],"математика, ЕГЭ","Магистр","МГУ",
-         [("Линал: с чего начать","Сводка тем.","")]),
-        ("bob@bots.dev","specialist","Bob","Lee","bob-coder",DEFAULT_AVATARS["specialist"],"python, алгоритмы","Магистр","ИТМО",
-         [("Python: 3 практики","Заметки для старта.","")]),
-    ]
-    for email, role, fn, ln, nick, avatar, kw, deg, work, posts in bots:
-        u = User(email=email, role=role, password_hash=argon2.hash("Passw0rd!"), first_name=fn, last_name=ln, nickname=nick, avatar=avatar)
-        if role == "specialist":
-            u.specialist = SpecialistProfile(education_degree=deg, workplace=work, keywords=kw)
-        db.session.add(u); db.session.commit()
-        for title, summary, img in posts:
-            db.session.add(Post(user_id=u.id, title=title, summary=summary, image=img))
-        db.session.commit()
-
-def ensure_schema():
-    engine = db.engine
-    inspector = inspect(engine)
-    user_cols = {col["name"] for col in inspector.get_columns("user")}
-    alters = []
-    # Экранируем имя таблицы "user" — кросс-СУБД безопаснее
-    if "age" not in user_cols:
-        alters.append('ALTER TABLE "user" ADD COLUMN age INTEGER')
-    if "education" not in user_cols:
-        alters.append('ALTER TABLE "user" ADD COLUMN education VARCHAR(255)')
-    if "graduation_year" not in user_cols:
-        alters.append('ALTER TABLE "user" ADD COLUMN graduation_year VARCHAR(10)')
-    if "course_image" not in user_cols:
-        alters.append('ALTER TABLE "user" ADD COLUMN course_image VARCHAR(255)')
-    if not alters:
-        return
-    # SQLAlchemy 2.x: сырые SQL через exec_driver_sql() или text(...)
-    with engine.begin() as conn:
-        for stmt in alters:
-            conn.exec_driver_sql(stmt)
-            # альтернатива:
-            # conn.execute(text(stmt))
-
-def translit(s):
-    table = {'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'e','ж':'zh','з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o','п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c','ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'}
-    return ''.join(table.get(ch, ch) for ch in (s or '').lower())
-
 # ---------- Роуты ----------
 def register_routes(app):
     @app.route("/set-theme/<theme>")
@@ -215,35 +151,56 @@ def register_routes(app):
         session["theme"] = theme if theme in ("light","dark") else "light"
         return ("",204)
 
+    @app.route("/set-lang/<lang>")
+    def set_lang(lang):
+        if lang in i18n.catalogs:
+            session["lang"] = lang
+        return redirect(request.referrer or url_for("login_screen"))
+
     @app.route("/logout")
     def logout():
         session.clear(); return redirect(url_for("login_screen"))
 
     @app.route("/")
+    @pages.page
     def login_screen():
         return render_template("login_single.html")
 
     @app.route("/login", methods=["GET","POST"])
+    @pages.page
     def login_single():
         if request.method == "POST":
             email = request.form.get("email","").strip().lower()
             password = request.form.get("password","")
             remember = bool(request.form.get("remember"))
             user = User.query.filter_by(email=email).first()
-            if not user or not argon2.verify(password, user.password_hash):
-                flash("Неверная пара email/пароль.","error")
+            try:
+                ok = bool(user) and passwords.verify(password, user.password_hash)
+            except HashingBusy:
+                flash(t("err_overloaded_login"),"error")
+                return render_template("login_single.html"), 503
+            if not ok:
+                flash(t("err_bad_credentials"),"error")
                 return render_template("login_single.html")
+            if passwords.needs_update(user.password_hash):
+                # параметры argon2 в конфиге поменялись — пересчитываем хеш, пока знаем пароль
+                try:
+                    user.password_hash = passwords.hash(password); db.session.commit()
+                except HashingBusy:
+                    pass
             session.clear(); session["user_id"] = user.id; session.permanent = True
-            if remember: app.permanent_session_lifetime = datetime.timedelta(days=int(app.config.get("REMEMBER_DAYS",30)))
-            else: app.permanent_session_lifetime = datetime.timedelta(days=int(app.config.get("SESSION_DAYS",7)))
+            days = app.config.get("REMEMBER_DAYS",30) if remember else app.config.get("SESSION_DAYS",7)
+            sessions.set_lifetime(session, datetime.timedelta(days=int(days)))
             return redirect(url_for("profile"))
         return render_template("login_single.html")
 
     @app.route("/register")
+    @pages.page
     def register():
         return render_template("register_choose.html")
 
     @app.route("/register/<role>", methods=["GET","POST"])
+    @pages.page
     def register_role(role):
         role = role.lower()
         if role not in ("student","specialist"): return redirect(url_for("register"))
@@ -254,38 +211,44 @@ def register_routes(app):
             stage = request.form.get("stage")
             if stage == "verify":
                 code = (request.form.get("code") or "").strip()
-                if not pending or pending.get("role") != role:
-                    flash("Сессия подтверждения истекла.","error")
+                if not pending or pending.get("role") != role or "password_hash" not in pending:
+                    flash(t("err_verify_expired"),"error")
                     return redirect(url_for("register_role", role=role))
                 if code != pending.get("code"):
-                    flash("Неверный код подтверждения.","error")
+                    flash(t("err_bad_code"),"error")
                     return render_template("register_verify.html", role=role, email=pending.get("email"))
                 if User.query.filter_by(email=pending.get("email")).first():
-                    flash("Почта уже зарегистрирована. Войдите.","error")
+                    flash(t("err_email_taken"),"error")
                     session.pop("pending_user", None)
                     return redirect(url_for("login_single"))
-                u = User(email=pending["email"], role=role, password_hash=argon2.hash(pending["password"]))
+                u = User(email=pending["email"], role=role, password_hash=pending["password_hash"])
                 if role=="student":
                     u.student = StudentProfile()
                 else:
                     u.specialist = SpecialistProfile()
                 db.session.add(u); db.session.commit()
                 session.clear(); session["user_id"]=u.id; session.permanent=True
-                flash("Регистрация подтверждена.","ok")
+                flash(t("ok_registered"),"ok")
                 return redirect(url_for("profile", tab="about"))
             email = request.form.get("email","").strip().lower()
             password = request.form.get("password","")
             confirm = request.form.get("confirm","")
             if password != confirm:
-                flash("Пароли не совпадают.","error"); return render_template("register_role.html", role=role)
+                flash(t("err_password_mismatch"),"error"); return render_template("register_role.html", role=role)
             if not email or not password:
-                flash("Укажите почту и пароль.","error"); return render_template("register_role.html", role=role)
+                flash(t("err_email_password_required"),"error"); return render_template("register_role.html", role=role)
             if User.query.filter_by(email=email).first():
-                flash("Почта уже зарегистрирована. Войдите.", "error"); return redirect(url_for("login_single"))
+                flash(t("err_email_taken"), "error"); return redirect(url_for("login_single"))
+            try:
+                pw_hash = passwords.hash(password)
+            except HashingBusy:
+                flash(t("err_overloaded"),"error")
+                return render_template("register_role.html", role=role), 503
             code = f"{random.randint(100000, 999999)}"
-            session["pending_user"] = {"email": email, "password": password, "role": role, "code": code}
+            # в сессии только хеш: пароль в открытом виде нигде не хранится
+            session["pending_user"] = {"email": email, "password_hash": pw_hash, "role": role, "code": code}
             print(f"[TriLink] Verification code for {email}: {code}")
-            flash("Код подтверждения отправлен. Проверьте консоль приложения.", "ok")
+            flash(t("ok_code_sent"), "ok")
             return render_template("register_verify.html", role=role, email=email)
         if pending and pending.get("role") == role:
             return render_template("register_verify.html", role=role, email=pending.get("email"))
@@ -304,7 +267,7 @@ def register_routes(app):
                     u.student = StudentProfile(looking_for=uni)
                 else:
                     u.student.looking_for = uni
-            db.session.commit()
+            db.session.commit(); profile_updated(u)
             if "cancel" in request.form: return redirect(url_for("profile"))
             return redirect(url_for("onb_avatar"))
         return render_template("onb_name.html")
@@ -318,9 +281,10 @@ def register_routes(app):
             if file and file.filename:
                 ext = file.filename.rsplit(".",1)[-1].lower()
                 if ext in ALLOWED_IMG:
-                    path = os.path.join(UPLOAD_FOLDER,"avatars", secure_filename(f"user{u.id}_avatar.{ext}"))
-                    os.makedirs(os.path.dirname(path), exist_ok=True)
-                    file.save(path); u.avatar = "/uploads/avatars/" + os.path.basename(path); db.session.commit()
+                    try:
+                        images.submit(file, "avatars", u.id, image_saved("avatar"))
+                    except ImageRejected:
+                        flash(t("err_bad_image"),"error"); return redirect(url_for("onb_avatar"))
             if "cancel" in request.form: return redirect(url_for("profile"))
             return redirect(url_for("onb_nick"))
         # здесь нужно строковое значение URL для предпросмотра
@@ -338,8 +302,8 @@ def register_routes(app):
             nick = request.form.get("nickname","").strip()
             deny = set(["admin","support","moderator","romie","trilink","superuser","help","owner"])
             if not nick or nick.lower() in deny or User.query.filter(User.nickname==nick, User.id!=u.id).first():
-                flash("Введите уникальный ник.","error"); return render_template("onb_nick.html", suggestions=suggestions)
-            u.nickname = nick; db.session.commit()
+                flash(t("err_nick_required"),"error"); return render_template("onb_nick.html", suggestions=suggestions)
+            u.nickname = nick; db.session.commit(); profile_updated(u)
             return redirect(url_for("welcome"))
         return render_template("onb_nick.html", suggestions=suggestions)
 
@@ -352,31 +316,44 @@ def register_routes(app):
     @app.route("/feed")
     @login_required
     def feed():
-        message = "Совсем скоро будет доступно!"
-        posts = []
-        # ensure_bots()  # оставлено закомментированным до включения ленты
-        return render_template("feed.html", posts=posts, disabled_message=message)
+        posts, next_cursor = feed_engine.timeline(session["user_id"], request.args.get("cursor"))
+        return render_template("feed.html", posts=posts, next_cursor=next_cursor)
+
+    @app.route("/feed/post", methods=["POST"])
+    @login_required
+    def feed_post():
+        u = current_user()
+        if u.role != "specialist":
+            abort(403)
+        title = (request.form.get("title") or "").strip()
+        summary = (request.form.get("summary") or "").strip()
+        if not title:
+            flash(t("err_post_title"),"error")
+        else:
+            feed_engine.publish(u, title[:255], summary)
+        return redirect(url_for("feed"))
 
     @app.route("/search")
     @login_required
     def search():
         q = (request.args.get("q") or "").strip()
-        q_clean = q.lstrip("@").lower()
-        ensure_bots()
-        people = User.query.order_by(User.created_at.desc()).all()
-        if q_clean:
-            def match(p):
-                hay = " ".join(filter(None, [
-                    p.first_name or "",
-                    p.last_name or "",
-                    p.nickname or "",
-                    p.role or "",
-                    (p.specialist.keywords if p.specialist else ""),
-                    (p.student.looking_for if p.student else ""),
-                ])).lower()
-                return q_clean in hay
-            people = list(filter(match, people))
-        return render_template("search.html", people=people, q=q)
+        page = request.args.get("page", 1, type=int) or 1
+        people, has_next = search_index.search_people(q, page)
+        u = current_user()
+        recommended = tags.recommend(u.id, 6) if not q and page == 1 and u.role == "student" else []
+        return render_template("search.html", people=people, q=q, page=page, has_next=has_next, recommended=recommended)
+
+    @app.route("/recommendations")
+    @login_required
+    def recommendations():
+        """Специалисты, подобранные по пересечению тегов с «что ищу» ученика."""
+        limit = min(request.args.get("limit", tags.RECOMMEND_LIMIT, type=int) or tags.RECOMMEND_LIMIT, tags.RECOMMEND_LIMIT)
+        ranked = tags.recommend(session["user_id"], limit)
+        return jsonify(specialists=[{
+            "id": p.id, "nickname": p.nickname, "first_name": p.first_name, "last_name": p.last_name,
+            "avatar": avatar_url(p, "sm"), "keywords": p.specialist.keywords if p.specialist else "",
+            "score": score, "url": url_for("public_profile", user_id=p.id),
+        } for p, score in ranked])
 
     @app.route("/support")
     def support_redirect():
@@ -386,48 +363,142 @@ def register_routes(app):
     @login_required
     def public_profile(user_id):
         person = User.query.get_or_404(user_id)
-        return render_template("user_public.html", person=person, avatar=avatar_url(person))
-
-    class ConvHelper:
-        @staticmethod
-        def get_or_create(a,b):
-            existing = db.session.query(Conversation).join(ConversationMember).filter(ConversationMember.user_id.in_([a,b])).all()
-            for c in existing:
-                ids = set(m.user_id for m in ConversationMember.query.filter_by(conversation_id=c.id))
-                if ids == set([a,b]): return c
-            c = Conversation(); db.session.add(c); db.session.commit()
-            db.session.add(ConversationMember(conversation_id=c.id, user_id=a))
-            db.session.add(ConversationMember(conversation_id=c.id, user_id=b)); db.session.commit()
-            return c
+        following = feed_engine.is_following(session["user_id"], user_id)
+        card = pages.fragment("user_public_card", "user", user_id,
+                              lambda: render_template("user_public_card.html", person=person, avatar=avatar_url(person)))
+        return render_template("user_public.html", person=person, card=card, is_following=following)
+
+    @app.route("/people/<int:user_id>/follow", methods=["POST"])
+    @login_required
+    def follow_toggle(user_id):
+        me = session["user_id"]
+        if me == user_id:
+            return redirect(url_for("public_profile", user_id=user_id))
+        User.query.get_or_404(user_id)
+        if not feed_engine.unfollow(me, user_id):
+            feed_engine.follow(me, user_id)
+        return redirect(url_for("public_profile", user_id=user_id))
 
     @app.route("/chat")
     @login_required
     def chat_index():
-        uid = session["user_id"]
-        conv_ids = [m.conversation_id for m in ConversationMember.query.filter_by(user_id=uid).all()]
-        convs = []
-        for cid in conv_ids:
-            other_id = [m.user_id for m in ConversationMember.query.filter_by(conversation_id=cid).all() if m.user_id!=uid][0]
-            other = User.query.get(other_id)
-            last = Message.query.filter_by(conversation_id=cid).order_by(Message.created_at.desc()).first()
-            convs.append({"id":cid,"other":other,"last":last})
-        return render_template("chat.html", conversations=convs)
+        convs, next_cursor = chat.list_conversations(session["user_id"], request.args.get("cursor"))
+        return render_template("chat.html", conversations=convs, next_cursor=next_cursor)
 
     @app.route("/chat/with/<int:user_id>", methods=["GET","POST"])
     @login_required
     def chat_with(user_id):
         me = session["user_id"]
         if me == user_id:
-            flash("Нельзя писать самому себе.","error"); return redirect(url_for("chat_index"))
+            flash(t("err_self_chat"),"error"); return redirect(url_for("chat_index"))
+        other = User.query.get_or_404(user_id)
         c = ConvHelper.get_or_create(me, user_id)
         if request.method == "POST":
             text_ = (request.form.get("text") or "").strip()
-            if text_:
-                db.session.add(Message(conversation_id=c.id, sender_id=me, text=text_)); db.session.commit()
-        msgs = Message.query.filter_by(conversation_id=c.id).order_by(Message.created_at.asc()).all()
-        other_id = [m.user_id for m in ConversationMember.query.filter_by(conversation_id=c.id).all() if m.user_id!=me][0]
-        other = User.query.get(other_id)
-        return render_template("chat_with.html", other=other, messages=msgs)
+            msg = chat.post_message(c, me, text_) if text_ else None
+            if wants_json():
+                return jsonify(message=chat.message_json(msg, me) if msg else None)
+            return redirect(url_for("chat_with", user_id=user_id))
+        chat.mark_read(c.id, me)
+        msgs, has_more = chat.history(c.id, request.args.get("before_id", type=int))
+        return render_template("chat_with.html", other=other, messages=msgs, has_more=has_more)
+
+    @app.route("/chat/with/<int:user_id>/messages")
+    @login_required
+    def chat_messages(user_id):
+        """JSON-история: ``before_id`` — страница старее, ``after_id`` — страница новее курсора.
+
+        ``has_more`` — есть ли ещё сообщения в ту же сторону.
+        """
+        me = session["user_id"]
+        c = ConvHelper.find(me, user_id)
+        if not c:
+            return jsonify(messages=[], has_more=False)
+        after_id = request.args.get("after_id", type=int)
+        if after_id is not None:
+            msgs, has_more = chat.messages_after(c.id, after_id)
+        else:
+            msgs, has_more = chat.history(c.id, request.args.get("before_id", type=int))
+        return jsonify(messages=[chat.message_json(m, me) for m in msgs], has_more=has_more)
+
+    @app.route("/chat/with/<int:user_id>/stream")
+    @login_required
+    def chat_stream(user_id):
+        """SSE-поток новых сообщений диалога; клиент переподключается сам с Last-Event-ID."""
+        me = session["user_id"]
+        c = ConvHelper.find(me, user_id) or abort(404)
+        cid = c.id
+        # курсор 0 — «с начала» (пустой диалог); None — клиент не прислал курсор, хвост не читаем
+        last_id = request.headers.get("Last-Event-ID", type=int)
+        if last_id is None:
+            last_id = request.args.get("after_id", type=int)
+        heartbeat = app.config["CHAT_STREAM_HEARTBEAT"]
+        deadline = time.monotonic() + app.config["CHAT_STREAM_MAX_AGE"]
+        # подписываемся до чтения хвоста из базы, чтобы не потерять сообщение между ними
+        sub = realtime.broker.subscribe(cid)
+
+        def catch_up(after_id):
+            msgs, has_more = [], after_id is not None
+            while has_more:
+                page, has_more = chat.messages_after(cid, after_id)
+                msgs += [chat.message_json(m, me) for m in page]
+                after_id = page[-1].id if page else after_id
+            db.session.remove()  # не держим соединение с БД, пока поток открыт
+            return msgs
+
+        def events():
+            seen = last_id
+            try:
+                yield "retry: 3000\n\n"
+                pending = catch_up(last_id)
+                while True:
+                    delivered = [p for p in pending if seen is None or p["id"] > seen]
+                    if delivered:
+                        # отмечаем до отправки: после yield генератор может и не продолжиться
+                        chat.mark_delivered(cid, me, delivered)
+                        db.session.remove()
+                    for payload in delivered:
+                        seen = payload["id"]
+                        yield realtime.sse_event(dict(payload, mine=payload["sender_id"] == me), payload["id"])
+                    if time.monotonic() > deadline:
+                        return
+                    try:
+                        pending = [sub.get(timeout=heartbeat)]
+                    except queue.Empty:
+                        yield ": ping\n\n"
+                        # сообщения, записанные другим процессом, брокер не увидит
+                        pending = catch_up(seen)
+            finally:
+                realtime.broker.unsubscribe(cid, sub)
+
+        return Response(stream_with_context(events()), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app.route("/chat/with/<int:user_id>/poll")
+    @login_required
+    def chat_poll(user_id):
+        """Long-poll для клиентов без EventSource: ждёт сообщения новее ``after_id``."""
+        me = session["user_id"]
+        c = ConvHelper.find(me, user_id) or abort(404)
+        cid = c.id
+        after_id = request.args.get("after_id", type=int)
+        sub = realtime.broker.subscribe(cid)
+        try:
+            # за раз отдаём одну страницу — клиент сразу переспросит с последним id
+            msgs = ([chat.message_json(m, me) for m in chat.messages_after(cid, after_id)[0]]
+                    if after_id is not None else [])
+            if not msgs:
+                db.session.remove()
+                try:
+                    payload = sub.get(timeout=app.config["CHAT_POLL_TIMEOUT"])
+                    msgs = [dict(payload, mine=payload["sender_id"] == me)]
+                except queue.Empty:
+                    pass
+        finally:
+            realtime.broker.unsubscribe(cid, sub)
+        msgs = [m for m in msgs if m["id"] > (after_id or 0)]
+        chat.mark_delivered(cid, me, msgs)
+        return jsonify(messages=msgs)
 
     @app.route("/profile", methods=["GET","POST"])
     @login_required
@@ -447,34 +518,35 @@ def register_routes(app):
                 if nickname:
                     existing = User.query.filter(User.nickname==nickname, User.id!=u.id).first()
                     if existing:
-                        flash("Никнейм уже занят.","error")
+                        flash(t("err_nick_taken"),"error")
                         return redirect(url_for("profile", tab="about"))
                 u.nickname = nickname
                 age_val = request.form.get("age","").strip()
                 try:
                     u.age = int(age_val) if age_val else None
                 except ValueError:
-                    flash("Возраст должен быть числом.","error")
+                    flash(t("err_age_number"),"error")
                     return redirect(url_for("profile", tab="about"))
                 u.education = request.form.get("education","").strip() or None
                 grad = request.form.get("graduation_year","").strip()
                 if grad and (not grad.isdigit() or len(grad) not in (2,4)):
-                    flash("Год выпуска должен состоять из цифр.","error")
+                    flash(t("err_grad_year_digits"),"error")
                     return redirect(url_for("profile", tab="about"))
                 u.graduation_year = grad or None
                 file = request.files.get("avatar")
                 if file and file.filename:
                     ext = file.filename.rsplit(".",1)[-1].lower()
-                    if ext in ALLOWED_IMG:
-                        path = os.path.join(UPLOAD_FOLDER,"avatars", secure_filename(f"user{u.id}_avatar.{ext}"))
-                        os.makedirs(os.path.dirname(path), exist_ok=True)
-                        file.save(path)
-                        u.avatar = "/uploads/avatars/" + os.path.basename(path)
-                    else:
-                        flash("Неподдерживаемый формат файла.","error")
+                    try:
+                        if ext not in ALLOWED_IMG:
+                            raise ImageRejected(ext)
+                        # аватар появится в профиле, когда фоновая обработка закончится
+                        images.submit(file, "avatars", u.id, image_saved("avatar"))
+                    except ImageRejected:
+                        flash(t("err_bad_image"),"error")
                         return redirect(url_for("profile", tab="about"))
                 db.session.commit()
-                flash("Профиль обновлён.","ok")
+                profile_updated(u)
+                flash(t("ok_profile_updated"),"ok")
                 return redirect(url_for("profile"))
             if action == "course":
                 if "cancel" in request.form:
@@ -482,24 +554,30 @@ def register_routes(app):
                 cover = request.files.get("course_image")
                 if cover and cover.filename:
                     ext = cover.filename.rsplit(".",1)[-1].lower()
-                    if ext in ALLOWED_IMG:
-                        path = os.path.join(UPLOAD_FOLDER, "courses", secure_filename(f"user{u.id}_course.{ext}"))
-                        os.makedirs(os.path.dirname(path), exist_ok=True)
-                        cover.save(path)
-                        u.course_image = "/uploads/courses/" + os.path.basename(path)
-                    else:
-                        flash("Неподдерживаемый формат файла.","error")
+                    try:
+                        if ext not in ALLOWED_IMG:
+                            raise ImageRejected(ext)
+                        images.submit(cover, "courses", u.id, image_saved("course_image"))
+                    except ImageRejected:
+                        flash(t("err_bad_image"),"error")
                         return redirect(url_for("profile", tab="course"))
                 db.session.commit()
-                flash("Изображение курса обновлено.","ok")
+                profile_updated(u)
+                flash(t("ok_course_updated"),"ok")
                 return redirect(url_for("profile", tab="course"))
         return render_template("profile.html", user=u, tab=tab, avatar=avatar_url(u))
 
     @app.route("/uploads/<path:filename>")
     def uploaded(filename):
-        return send_from_directory(UPLOAD_FOLDER, filename)
+        return assets.send_upload(app.config["UPLOAD_FOLDER"], filename)
 
-app = create_app()
+def __getattr__(name):
+    # `app:app` (flask, gunicorn) создаёт приложение при первом обращении, а не при импорте:
+    # `from app import create_app` не должен мигрировать и открывать instance/app.db
+    if name == "app":
+        globals()["app"] = create_app()
+        return globals()["app"]
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 if __name__ == "__main__":
-    app.run(debug=True)
+    create_app().run(debug=True)
@@ -0,0 +1,103 @@
+# -*- coding: utf-8 -*-
+"""Кэшируемая раздача статики и загрузок.
+
+* ``url_for('static', ...)`` получает ключ версии ``?v=<хеш содержимого>``,
+  поэтому такие ответы можно кэшировать «навсегда» (immutable).
+* Обработанные загрузки уже лежат под именами с хешем содержимого
+  (см. images.py) и тоже отдаются с долгим Cache-Control; старые имена
+  отдаются с коротким max-age и ETag/Last-Modified, повторный запрос получает 304.
+* ``UPLOADS_ACCEL_REDIRECT`` / ``USE_X_SENDFILE`` позволяют отдать байты
+  фронтовому прокси (nginx / Apache, lighttpd).
+"""
+import hashlib
+import mimetypes
+import os
+import re
+import threading
+
+from flask import Response, abort, request, send_from_directory
+from werkzeug.security import safe_join
+
+HASHED_NAME_RE = re.compile(r"\.[0-9a-f]{10}-[a-z]+\.\w+$")
+STATIC_PREFIX = "/static/"
+
+_hashes = {}
+_lock = threading.Lock()
+_app = None
+
+
+def content_hash(data):
+    return hashlib.sha1(data).hexdigest()[:10]
+
+
+def file_hash(path, check_mtime=False):
+    """Хеш содержимого файла; пересчитывается только при смене mtime (если check_mtime)."""
+    cached = _hashes.get(path)
+    if cached and not check_mtime:
+        return cached[1]
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return None
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, "rb") as fh:
+        digest = content_hash(fh.read())
+    with _lock:
+        _hashes[path] = (mtime, digest)
+    return digest
+
+
+def versioned(url):
+    """Добавляет ?v=<хеш> к URL файла из static/ (например, аватаров по умолчанию)."""
+    if _app is None or not url or not url.startswith(STATIC_PREFIX) or "?" in url:
+        return url
+    digest = file_hash(os.path.join(_app.static_folder, url[len(STATIC_PREFIX):]), _app.debug)
+    return f"{url}?v={digest}" if digest else url
+
+
+def send_upload(folder, filename):
+    cfg = _app.config
+    hashed = bool(HASHED_NAME_RE.search(filename))
+    max_age = cfg["IMMUTABLE_MAX_AGE"] if hashed else cfg["UPLOAD_MAX_AGE"]
+    accel = cfg["UPLOADS_ACCEL_REDIRECT"]
+    if accel:
+        path = safe_join(folder, filename)
+        if path is None or not os.path.isfile(path):
+            abort(404)
+        resp = Response(mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        resp.headers["X-Accel-Redirect"] = accel.rstrip("/") + "/" + filename
+        resp.cache_control.max_age = max_age
+    else:
+        # send_file сам выставит ETag/Last-Modified и ответит 304 на условный запрос;
+        # при USE_X_SENDFILE вместо тела уйдёт заголовок X-Sendfile
+        resp = send_from_directory(folder, filename, max_age=max_age)
+    resp.cache_control.public = True
+    if hashed:
+        resp.cache_control.immutable = True
+    return resp
+
+
+def init_app(app):
+    global _app
+    _app = app
+    cfg = app.config
+    cfg.setdefault("IMMUTABLE_MAX_AGE", 365 * 24 * 3600)
+    cfg.setdefault("UPLOAD_MAX_AGE", 300)
+    cfg.setdefault("UPLOADS_ACCEL_REDIRECT", None)  # например "/_protected_uploads/"
+
+    @app.url_defaults
+    def _static_version(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            digest = file_hash(os.path.join(app.static_folder, values["filename"]), app.debug)
+            if digest:
+                values["v"] = digest
+
+    @app.after_request
+    def _static_cache_headers(resp):
+        if request.endpoint == "static" and request.args.get("v") and resp.status_code in (200, 304):
+            resp.cache_control.max_age = cfg["IMMUTABLE_MAX_AGE"]
+            resp.cache_control.public = True
+            resp.cache_control.immutable = True
+            resp.cache_control.no_cache = None
+        return resp
@@ -0,0 +1,12 @@
+# -*- coding: utf-8 -*-
+"""Бенчмарк основных сценариев TriLink.
+
+Строит отдельную SQLite-базу с синтетическими данными заданного масштаба
+(``seed.generate``), прогоняет сценарии (вход, поиск, список диалогов, диалог,
+отправка сообщения, лента, профиль, рекомендации) через Flask test client и
+пишет p50/p90/p99 и число SQL-запросов в JSON. С ``--baseline`` сравнивает
+прогон с сохранённым и завершается с кодом 1 при регрессии.
+
+    python -m bench --users 2000 --conversations 5000 --out bench/results/latest.json
+    python -m bench --baseline bench/results/baseline.json --threshold 0.15
+"""
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+import argparse
+import os
+import sys
+
+# бенчмарк запускается из корня репозитория: python -m bench
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bench import runner  # noqa: E402
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m bench", description="Бенчмарк сценариев TriLink.")
+    parser.add_argument("--users", type=int, default=2000)
+    parser.add_argument("--conversations", type=int, default=4000)
+    parser.add_argument("--messages", type=int, default=20, help="сообщений на диалог")
+    parser.add_argument("--follows", type=int, default=10, help="подписок у каждого ученика")
+    parser.add_argument("--posts", type=int, default=5, help="постов у каждого специалиста")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--login-iterations", type=int, default=20, help="входов (argon2 медленный намеренно)")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--only", nargs="*", help="прогнать только указанные сценарии")
+    parser.add_argument("--out", help="куда сохранить JSON-отчёт")
+    parser.add_argument("--baseline", help="JSON прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=0.15, help="допустимое замедление, доля (0.15 = 15%%)")
+    parser.add_argument("--metric", default="p50_ms", choices=["p50_ms", "p90_ms", "p99_ms", "mean_ms"])
+    parser.add_argument("--keep-db", action="store_true", help="не удалять сгенерированную базу")
+    args = parser.parse_args(argv)
+
+    scale = {"users": args.users, "conversations": args.conversations, "messages": args.messages,
+             "follows": args.follows, "posts": args.posts}
+    report = runner.run(scale, args.iterations, args.warmup, args.seed, only=args.only,
+                        login_iterations=args.login_iterations, keep_db=args.keep_db)
+    print(runner.format_table(report))
+    if args.out:
+        runner.save(report, args.out)
+        print(f"\nОтчёт сохранён: {args.out}")
+    if args.baseline:
+        lines, regressions = runner.compare(report, runner.load(args.baseline), args.threshold, args.metric)
+        print("\nСравнение с", args.baseline)
+        print("\n".join(lines))
+        if regressions:
+            print(f"\nРегрессии: {', '.join(regressions)}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,226 @@
+# -*- coding: utf-8 -*-
+"""Прогон пользовательских сценариев через test client и сравнение с базовым прогоном."""
+import datetime
+import json
+import os
+import platform
+import re
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+
+from sqlalchemy import func
+
+CARD = re.compile(r'<section class="profile-public">.*?</section>', re.S)
+SERVER_TIMING_DB = re.compile(r'db;dur=[\d.]+;desc="(\d+) queries"')
+
+
+def percentile(values, p):
+    """Перцентиль с линейной интерполяцией (как numpy.percentile по умолчанию)."""
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    k = (len(ordered) - 1) * p / 100
+    lo = int(k)
+    hi = min(lo + 1, len(ordered) - 1)
+    return ordered[lo] + (ordered[hi] - ordered[lo]) * (k - lo)
+
+
+def build_app(workdir, scale, seed, overrides=None):
+    """Приложение на отдельной SQLite-базе в ``workdir`` с синтетическими данными."""
+    from app import create_app
+    import seed as seeding
+    from models import db
+
+    config = {
+        "SQLALCHEMY_DATABASE_URI": "sqlite:///" + os.path.join(workdir, "bench.db"),
+        # замеры запросов нужны бенчмарку для подсчёта SQL (Server-Timing)
+        "PROFILING_ENABLED": True,
+        "PROFILE_SLOW_MS": None,
+        "RESPONSE_CACHE_DIR": os.path.join(workdir, "page-cache"),
+        "TESTING": True,
+    }
+    config.update(overrides or {})
+    app = create_app(config)
+    with app.app_context():
+        started = time.perf_counter()
+        seeding.generate(scale["users"], scale["conversations"], scale["messages"], seed,
+                         follows=scale["follows"], posts=scale["posts"])
+        seeded = time.perf_counter() - started
+        db.session.remove()
+    return app, seeded
+
+
+def pick_actors(app):
+    """Самый «тяжёлый» пользователь (больше всего диалогов), его собеседник и ученик с самой длинной лентой."""
+    from models import db, ConversationMember, Follow, User
+    from seed import SYNTHETIC_DOMAIN
+
+    with app.app_context():
+        me, _ = (db.session.query(ConversationMember.user_id, func.count())
+                 .group_by(ConversationMember.user_id).order_by(func.count().desc()).first())
+        other = (db.session.query(ConversationMember.user_id)
+                 .filter(ConversationMember.conversation_id.in_(
+                     db.session.query(ConversationMember.conversation_id).filter(ConversationMember.user_id == me)),
+                         ConversationMember.user_id != me)
+                 .order_by(ConversationMember.last_activity_at.desc()).first()[0])
+        reader = (db.session.query(Follow.follower_id, func.count()).group_by(Follow.follower_id)
+                  .order_by(func.count().desc()).first() or (me,))[0]
+        specialist = User.query.filter_by(role="specialist").order_by(User.follower_count.desc()).first().id
+        email = db.session.get(User, me).email
+        assert email.endswith(SYNTHETIC_DOMAIN)
+        db.session.remove()
+    return {"me": me, "other": other, "reader": reader, "specialist": specialist, "email": email}
+
+
+def check(app, actors):
+    """Проверки корректности перед замерами: ускорение не должно менять содержимое страниц."""
+    from models import User
+
+    with app.app_context():
+        a, b = [u.id for u in User.query.filter(User.id != actors["me"]).order_by(User.id).limit(2)]
+    client = app.test_client()
+    with client.session_transaction() as s:
+        s["user_id"] = actors["me"]
+    # карточки профилей кэшируются фрагментами — разные люди должны получить разные карточки
+    cards = [CARD.search(client.get(f"/people/{uid}").get_data(as_text=True)).group(0) for uid in (a, b, a)]
+    if cards[0] == cards[1] or cards[0] != cards[2]:
+        raise AssertionError(f"/people/{a} и /people/{b}: кэш фрагментов перепутал карточки")
+
+
+def journeys(actors, password):
+    """Сценарии: имя -> (от чьего имени, функция(client, i) -> response)."""
+    from seed import SUBJECTS
+
+    me, other = actors["me"], actors["other"]
+    return {
+        "login": (None, lambda c, i: c.post("/login", data={"email": actors["email"], "password": password})),
+        "search_empty": (me, lambda c, i: c.get("/search")),
+        "search_query": (me, lambda c, i: c.get("/search", query_string={"q": SUBJECTS[i % len(SUBJECTS)]})),
+        "search_page3": (me, lambda c, i: c.get("/search", query_string={"q": SUBJECTS[i % len(SUBJECTS)], "page": 3})),
+        "chat_index": (me, lambda c, i: c.get("/chat")),
+        "chat_with": (me, lambda c, i: c.get(f"/chat/with/{other}")),
+        "chat_send": (me, lambda c, i: c.post(f"/chat/with/{other}", data={"text": f"bench {i}"},
+                                              headers={"Accept": "application/json"})),
+        "feed": (actors["reader"], lambda c, i: c.get("/feed")),
+        "public_profile": (me, lambda c, i: c.get(f"/people/{actors['specialist']}")),
+        "recommendations": (actors["reader"], lambda c, i: c.get("/recommendations")),
+    }
+
+
+def run_journey(app, user_id, request, iterations, warmup):
+    client = app.test_client()
+    if user_id is not None:
+        with client.session_transaction() as s:
+            s["user_id"] = user_id
+    timings, queries, sizes, statuses = [], [], [], {}
+    for i in range(warmup + iterations):
+        started = time.perf_counter()
+        resp = request(client, i)
+        body = resp.get_data()
+        elapsed = time.perf_counter() - started
+        if i < warmup:
+            continue
+        timings.append(elapsed * 1000)
+        sizes.append(len(body))
+        statuses[resp.status_code] = statuses.get(resp.status_code, 0) + 1
+        m = SERVER_TIMING_DB.search(resp.headers.get("Server-Timing", ""))
+        if m:
+            queries.append(int(m.group(1)))
+    return {
+        "iterations": iterations,
+        "p50_ms": round(percentile(timings, 50), 3),
+        "p90_ms": round(percentile(timings, 90), 3),
+        "p99_ms": round(percentile(timings, 99), 3),
+        "mean_ms": round(statistics.fmean(timings), 3) if timings else 0.0,
+        "max_ms": round(max(timings), 3) if timings else 0.0,
+        "queries": max(queries) if queries else None,
+        "bytes": int(statistics.median(sizes)) if sizes else 0,
+        "statuses": {str(k): v for k, v in sorted(statuses.items())},
+    }
+
+
+def _git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              timeout=5).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def run(scale, iterations, warmup, seed, only=None, login_iterations=None, overrides=None, keep_db=False):
+    """Полный прогон; возвращает словарь для JSON-отчёта."""
+    from seed import DEMO_PASSWORD
+
+    workdir = tempfile.mkdtemp(prefix="trilink-bench-")
+    try:
+        app, seeded = build_app(workdir, scale, seed, overrides)
+        actors = pick_actors(app)
+        check(app, actors)
+        results = {}
+        for name, (user_id, request) in journeys(actors, DEMO_PASSWORD).items():
+            if only and name not in only:
+                continue
+            # вход упирается в argon2 — по умолчанию гоняем его меньше
+            n = login_iterations if name == "login" and login_iterations else iterations
+            results[name] = run_journey(app, user_id, request, n, min(warmup, n))
+    finally:
+        if not keep_db:
+            shutil.rmtree(workdir, ignore_errors=True)
+    return {
+        "meta": {
+            "created_at": datetime.datetime.utcnow().isoformat(timespec="seconds") + "Z",
+            "git": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "scale": scale,
+            "seed": seed,
+            "seed_seconds": round(seeded, 2),
+            "warmup": warmup,
+            "workdir": workdir if keep_db else None,
+        },
+        "results": results,
+    }
+
+
+def compare(current, baseline, threshold, metric="p50_ms"):
+    """Сравнение с базовым прогоном: список строк отчёта и список регрессий."""
+    lines, regressions = [], []
+    base = baseline.get("results", {})
+    if baseline.get("meta", {}).get("scale") != current["meta"]["scale"]:
+        lines.append("! масштаб данных отличается от базового прогона — сравнение приблизительное")
+    for name, cur in current["results"].items():
+        old = base.get(name)
+        if not old:
+            lines.append(f"  {name:<16} нет в базовом прогоне")
+            continue
+        delta = (cur[metric] - old[metric]) / old[metric] if old[metric] else 0.0
+        slower = delta > threshold
+        more_queries = old.get("queries") is not None and cur.get("queries") is not None and cur["queries"] > old["queries"]
+        mark = "REGRESSION" if slower or more_queries else "ok"
+        lines.append(f"  {name:<16} {metric} {old[metric]:>9.2f} -> {cur[metric]:>9.2f} ({delta:+.0%}); "
+                     f"queries {old.get('queries')} -> {cur.get('queries')}  {mark}")
+        if mark != "ok":
+            regressions.append(name)
+    return lines, regressions
+
+
+def format_table(report):
+    lines = [f"{'journey':<16} {'p50':>9} {'p90':>9} {'p99':>9} {'queries':>8} {'bytes':>8}  statuses"]
+    for name, r in report["results"].items():
+        lines.append(f"{name:<16} {r['p50_ms']:>9.2f} {r['p90_ms']:>9.2f} {r['p99_ms']:>9.2f} "
+                     f"{str(r['queries']):>8} {r['bytes']:>8}  {r['statuses']}")
+    return "\n".join(lines)
+
+
+def load(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save(report, path):
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
@@ -0,0 +1,161 @@
+# -*- coding: utf-8 -*-
+"""Кэши с ограничением размера и временем жизни записей.
+
+У всех бэкендов один интерфейс: get/set(ttl)/delete/clear.
+"""
+import collections
+import hashlib
+import os
+import pickle
+import threading
+import time
+
+_MISSING = object()
+
+
+class MemoryCache:
+    """LRU-кэш с TTL, безопасный для использования из нескольких потоков."""
+
+    def __init__(self, maxsize=1024, ttl=60):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = collections.OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key, _MISSING)
+            if item is _MISSING:
+                return default
+            expires, value = item
+            if expires is not None and expires < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+
+class FileCache:
+    """Кэш в файлах каталога — общий для нескольких воркеров на одной машине.
+
+    Каталог в tmpfs (например, /dev/shm/trilink-cache) даёт разделяемую память
+    без внешнего сервиса. Запись атомарна (временный файл + rename), вытеснение —
+    по TTL при чтении и по числу файлов при записи.
+    """
+
+    def __init__(self, directory, maxsize=10000, ttl=60):
+        self.directory = directory
+        self.maxsize = maxsize
+        self.ttl = ttl
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, hashlib.sha1(repr(key).encode("utf-8")).hexdigest())
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                expires, value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        if expires is not None and expires < time.time():
+            self._unlink(path)
+            return default
+        return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.ttl if ttl is None else ttl
+        if ttl is not None and ttl <= 0:
+            return
+        expires = time.time() + ttl if ttl else None
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            pickle.dump((expires, value), f, pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _prune(self):
+        names = os.listdir(self.directory)
+        if len(names) <= self.maxsize:
+            return
+        paths = sorted((os.path.join(self.directory, n) for n in names), key=self._mtime)
+        for path in paths[:len(paths) - self.maxsize]:
+            self._unlink(path)
+
+    @staticmethod
+    def _mtime(path):
+        try:
+            return os.path.getmtime(path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _unlink(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def delete(self, key):
+        self._unlink(self._path(key))
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._unlink(os.path.join(self.directory, name))
+
+    def __len__(self):
+        return len(os.listdir(self.directory))
+
+
+class NullCache:
+    """Ничего не хранит — чтобы выключить кэширование, не трогая вызывающий код."""
+
+    def get(self, key, default=None):
+        return default
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def clear(self):
+        pass
+
+    def __len__(self):
+        return 0
+
+
+def make_cache(backend, maxsize=1024, ttl=60, directory=None):
+    """Кэш по имени бэкенда: "memory", "file" (нужен ``directory``) или "null"."""
+    if backend == "memory":
+        return MemoryCache(maxsize=maxsize, ttl=ttl)
+    if backend == "file":
+        return FileCache(directory, maxsize=maxsize, ttl=ttl)
+    if backend == "null":
+        return NullCache()
+    raise ValueError(f"неизвестный бэкенд кэша: {backend!r}")
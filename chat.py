@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+"""Запись сообщений и список диалогов.
+
+Сводка по диалогу (последнее сообщение, время активности, счётчики непрочитанного)
+хранится денормализованно в ``conversation`` и ``conversation_member`` и
+обновляется в той же транзакции, что и само сообщение. Поэтому список диалогов
+строится одним запросом независимо от размера «входящих».
+"""
+import datetime
+
+from sqlalchemy import and_, case, or_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from models import db, User, Conversation, ConversationMember, Message
+from realtime import broker
+
+INBOX_PAGE = 30
+HISTORY_PAGE = 50
+EPOCH = datetime.datetime(1970, 1, 1)
+
+
+class ConvHelper:
+    @staticmethod
+    def pair(a, b):
+        return (a, b) if a < b else (b, a)
+
+    @staticmethod
+    def find(a, b):
+        low, high = ConvHelper.pair(a, b)
+        return Conversation.query.filter_by(pair_low=low, pair_high=high).first()
+
+    @staticmethod
+    def get_or_create(a, b):
+        c = ConvHelper.find(a, b)
+        if c:
+            return c
+        low, high = ConvHelper.pair(a, b)
+        c = Conversation(pair_low=low, pair_high=high)
+        db.session.add(c)
+        try:
+            db.session.flush()
+            db.session.add_all([
+                ConversationMember(conversation_id=c.id, user_id=uid, last_activity_at=c.last_activity_at)
+                for uid in (low, high)
+            ])
+            db.session.commit()
+        except IntegrityError:
+            # параллельный запрос успел создать этот же диалог — берём его
+            db.session.rollback()
+            c = ConvHelper.find(a, b)
+        return c
+
+
+def merge_duplicate_pairs(conn):
+    """Заполняет pair_low/pair_high у старых диалогов и сливает дубли одной пары в самый ранний."""
+    conn.execute(text(
+        "UPDATE conversation SET "
+        "pair_low = (SELECT MIN(m.user_id) FROM conversation_member m WHERE m.conversation_id = conversation.id), "
+        "pair_high = (SELECT MAX(m.user_id) FROM conversation_member m WHERE m.conversation_id = conversation.id) "
+        "WHERE (SELECT COUNT(DISTINCT m.user_id) FROM conversation_member m WHERE m.conversation_id = conversation.id) = 2"
+    ))
+    rows = conn.execute(text("SELECT id, pair_low, pair_high FROM conversation WHERE pair_low IS NOT NULL ORDER BY id")).fetchall()
+    canonical = {}
+    for cid, low, high in rows:
+        keep = canonical.setdefault((low, high), cid)
+        if keep == cid:
+            continue
+        params = {"keep": keep, "cid": cid}
+        conn.execute(text("UPDATE message SET conversation_id = :keep WHERE conversation_id = :cid"), params)
+        conn.execute(text("DELETE FROM conversation_member WHERE conversation_id = :cid"), params)
+        conn.execute(text("DELETE FROM conversation WHERE id = :cid"), params)
+
+
+def post_message(conv, sender_id, text_):
+    now = datetime.datetime.utcnow()
+    msg = Message(conversation_id=conv.id, sender_id=sender_id, text=text_, created_at=now)
+    db.session.add(msg)
+    db.session.flush()
+    conv.last_message_id = msg.id
+    conv.last_activity_at = now
+    ConversationMember.query.filter_by(conversation_id=conv.id).update({
+        ConversationMember.last_activity_at: now,
+        ConversationMember.unread_count: case(
+            (ConversationMember.user_id != sender_id, ConversationMember.unread_count + 1),
+            else_=ConversationMember.unread_count,
+        ),
+    }, synchronize_session=False)
+    db.session.commit()
+    broker.publish(conv.id, message_json(msg, sender_id))
+    return msg
+
+
+def mark_read(conversation_id, user_id):
+    updated = ConversationMember.query.filter(
+        ConversationMember.conversation_id == conversation_id,
+        ConversationMember.user_id == user_id,
+        ConversationMember.unread_count != 0,
+    ).update({ConversationMember.unread_count: 0}, synchronize_session=False)
+    if updated:
+        db.session.commit()
+
+
+def mark_delivered(conversation_id, user_id, payloads):
+    """Сообщения собеседника, доставленные в открытый диалог (SSE, long-poll), считаются прочитанными."""
+    if any(p["sender_id"] != user_id for p in payloads):
+        mark_read(conversation_id, user_id)
+
+
+def encode_cursor(ts, conversation_id):
+    return f"{(ts - EPOCH) // datetime.timedelta(microseconds=1)}.{conversation_id}"
+
+
+def decode_cursor(cursor):
+    try:
+        micros, cid = cursor.split(".", 1)
+        return EPOCH + datetime.timedelta(microseconds=int(micros)), int(cid)
+    except (AttributeError, ValueError):
+        return None
+
+
+def list_conversations(user_id, cursor=None, limit=INBOX_PAGE):
+    """Страница диалогов пользователя по убыванию активности.
+
+    Возвращает (список {"id", "other", "last", "unread"}, курсор следующей страницы или None).
+    """
+    mine = aliased(ConversationMember)
+    other = aliased(ConversationMember)
+    q = (db.session.query(mine, User, Message)
+         .join(other, and_(other.conversation_id == mine.conversation_id, other.user_id != mine.user_id))
+         .join(User, User.id == other.user_id)
+         .join(Conversation, Conversation.id == mine.conversation_id)
+         .outerjoin(Message, Message.id == Conversation.last_message_id)
+         .filter(mine.user_id == user_id))
+    after = decode_cursor(cursor) if cursor else None
+    if after:
+        ts, cid = after
+        q = q.filter(or_(mine.last_activity_at < ts,
+                         and_(mine.last_activity_at == ts, mine.conversation_id < cid)))
+    rows = q.order_by(mine.last_activity_at.desc(), mine.conversation_id.desc()).limit(limit + 1).all()
+    convs = [{"id": m.conversation_id, "other": u, "last": last, "unread": m.unread_count}
+             for m, u, last in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        m = rows[limit - 1][0]
+        next_cursor = encode_cursor(m.last_activity_at, m.conversation_id)
+    return convs, next_cursor
+
+
+def _cursor_message(conversation_id, message_id):
+    return Message.query.filter_by(id=message_id, conversation_id=conversation_id).first()
+
+
+def history(conversation_id, before_id=None, limit=HISTORY_PAGE):
+    """Последние ``limit`` сообщений (или предшествующие ``before_id``) в порядке времени.
+
+    Возвращает (сообщения по возрастанию, есть_ли_более_старые).
+    """
+    q = Message.query.filter(Message.conversation_id == conversation_id)
+    if before_id:
+        cur = _cursor_message(conversation_id, before_id)
+        if not cur:
+            return [], False
+        q = q.filter(or_(Message.created_at < cur.created_at,
+                         and_(Message.created_at == cur.created_at, Message.id < cur.id)))
+    rows = q.order_by(Message.created_at.desc(), Message.id.desc()).limit(limit + 1).all()
+    return rows[:limit][::-1], len(rows) > limit
+
+
+def messages_after(conversation_id, after_id, limit=HISTORY_PAGE):
+    """Первые ``limit`` сообщений новее ``after_id`` по возрастанию времени.
+
+    Возвращает (сообщения, есть_ли_ещё_более_новые).
+    """
+    q = Message.query.filter(Message.conversation_id == conversation_id)
+    if after_id:
+        cur = _cursor_message(conversation_id, after_id)
+        if not cur:
+            return [], False
+        q = q.filter(or_(Message.created_at > cur.created_at,
+                         and_(Message.created_at == cur.created_at, Message.id > cur.id)))
+    rows = q.order_by(Message.created_at.asc(), Message.id.asc()).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
+
+
+def message_json(m, me):
+    return {
+        "id": m.id,
+        "text": m.text,
+        "sender_id": m.sender_id,
+        "mine": m.sender_id == me,
+        "created_at": m.created_at.isoformat(),
+        "time": m.created_at.strftime("%H:%M"),
+    }
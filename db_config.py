@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+"""Настройки движка БД по бэкенду.
+
+SQLite: на каждое новое соединение выставляются прагмы — WAL (читатели не ждут
+писателя), synchronous=NORMAL, busy_timeout, mmap и размер кэша страниц.
+PostgreSQL/MySQL: пул соединений с pre-ping и периодическим пересозданием.
+Бэкенд выбирается строкой ``SQLALCHEMY_DATABASE_URI`` в instance/config.py,
+модели при этом не меняются.
+"""
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+from models import db
+
+SQLITE_PRAGMAS = {
+    "journal_mode": "WAL",
+    "synchronous": "NORMAL",
+    "busy_timeout": 5000,        # мс ожидания блокировки вместо мгновенного "database is locked"
+    "mmap_size": 268435456,      # 256 MiB
+    "cache_size": -65536,        # отрицательное значение — в KiB, т.е. 64 MiB
+    "temp_store": "MEMORY",
+}
+
+
+def engine_options(app):
+    """SQLALCHEMY_ENGINE_OPTIONS по умолчанию для выбранного бэкенда."""
+    cfg = app.config
+    url = make_url(cfg["SQLALCHEMY_DATABASE_URI"])
+    if url.get_backend_name() == "sqlite":
+        if not url.database or url.database == ":memory:":
+            return {}
+        # писатель в SQLite всё равно один; пул держит соединения с уже выставленными прагмами
+        return {"pool_size": cfg["DB_POOL_SIZE"], "max_overflow": cfg["DB_MAX_OVERFLOW"], "pool_timeout": cfg["DB_POOL_TIMEOUT"]}
+    return {
+        "pool_size": cfg["DB_POOL_SIZE"],
+        "max_overflow": cfg["DB_MAX_OVERFLOW"],
+        "pool_timeout": cfg["DB_POOL_TIMEOUT"],
+        "pool_recycle": cfg["DB_POOL_RECYCLE"],
+        "pool_pre_ping": True,
+    }
+
+
+def configure(app):
+    """Вызывается до db.init_app(): дополняет конфиг параметрами пула."""
+    cfg = app.config
+    cfg.setdefault("DB_POOL_SIZE", 10)
+    cfg.setdefault("DB_MAX_OVERFLOW", 20)
+    cfg.setdefault("DB_POOL_TIMEOUT", 30)
+    cfg.setdefault("DB_POOL_RECYCLE", 1800)
+    cfg.setdefault("SQLITE_PRAGMAS", {})
+    options = engine_options(app)
+    options.update(cfg.get("SQLALCHEMY_ENGINE_OPTIONS") or {})
+    cfg["SQLALCHEMY_ENGINE_OPTIONS"] = options
+
+
+def install_pragmas(app):
+    """Вызывается после db.init_app(): вешает прагмы на connect-событие движка SQLite."""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != "sqlite":
+        return
+    pragmas = dict(SQLITE_PRAGMAS, **app.config["SQLITE_PRAGMAS"])
+
+    @event.listens_for(engine, "connect")
+    def _set_pragmas(dbapi_conn, record):
+        cur = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                if value is not None:
+                    cur.execute(f"PRAGMA {name}={value}")
+        finally:
+            cur.close()
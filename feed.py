@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+"""Лента: подписки, fan-out при публикации и постраничное чтение.
+
+Пост обычного автора при публикации раскладывается в ``timeline_entry`` всем
+подписчикам (и самому автору) одним INSERT ... SELECT. У авторов, у которых
+подписчиков больше ``FEED_FANOUT_LIMIT``, раскладки нет: такой пост получает
+``fanned_out=False`` и подмешивается при чтении всем подписчикам автора — даже
+если позже подписчиков у автора станет меньше порога. Страница ленты читается
+keyset-курсором по (created_at, post_id) и стоит постоянное число запросов:
+записи ленты, неразложенные посты, сами посты вместе с авторами.
+"""
+import datetime
+
+from flask import current_app
+from sqlalchemy import and_, or_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import joinedload
+
+from chat import decode_cursor, encode_cursor
+from models import db, User, Post, Follow, TimelineEntry
+
+FEED_PAGE = 20
+FOLLOW_BACKFILL = 50
+
+
+def fanout_limit():
+    return current_app.config.get("FEED_FANOUT_LIMIT", 5000)
+
+
+def publish(author, title, summary, image="", commit=True):
+    now = datetime.datetime.utcnow()
+    fan_out = (author.follower_count or 0) <= fanout_limit()
+    post = Post(user_id=author.id, title=title, summary=summary, image=image, created_at=now, fanned_out=fan_out)
+    db.session.add(post)
+    db.session.flush()
+    params = {"pid": post.id, "aid": author.id, "ts": now}
+    db.session.execute(text(
+        "INSERT INTO timeline_entry (user_id, post_id, author_id, created_at) VALUES (:aid, :pid, :aid, :ts)"), params)
+    if fan_out:
+        db.session.execute(text(
+            "INSERT INTO timeline_entry (user_id, post_id, author_id, created_at) "
+            "SELECT follower_id, :pid, :aid, :ts FROM follow WHERE followee_id = :aid"), params)
+    if commit:
+        db.session.commit()
+    return post
+
+
+def is_following(follower_id, followee_id):
+    return db.session.query(Follow.id).filter_by(follower_id=follower_id, followee_id=followee_id).first() is not None
+
+
+def follow(follower_id, followee_id):
+    """Подписка; возвращает False, если она уже была."""
+    db.session.add(Follow(follower_id=follower_id, followee_id=followee_id))
+    try:
+        db.session.flush()
+    except IntegrityError:
+        db.session.rollback()
+        return False
+    User.query.filter_by(id=followee_id).update({User.follower_count: User.follower_count + 1}, synchronize_session=False)
+    followee = db.session.get(User, followee_id)
+    if followee.follower_count <= fanout_limit():
+        # свежие посты автора сразу появляются в ленте нового подписчика
+        db.session.execute(text(
+            "INSERT INTO timeline_entry (user_id, post_id, author_id, created_at) "
+            "SELECT :uid, p.id, p.user_id, p.created_at FROM post p WHERE p.user_id = :aid "
+            "ORDER BY p.created_at DESC, p.id DESC LIMIT :n"),
+            {"uid": follower_id, "aid": followee_id, "n": FOLLOW_BACKFILL})
+    db.session.commit()
+    return True
+
+
+def unfollow(follower_id, followee_id):
+    deleted = Follow.query.filter_by(follower_id=follower_id, followee_id=followee_id).delete(synchronize_session=False)
+    if deleted:
+        User.query.filter_by(id=followee_id).update({User.follower_count: User.follower_count - 1}, synchronize_session=False)
+        TimelineEntry.query.filter_by(user_id=follower_id, author_id=followee_id).delete(synchronize_session=False)
+    db.session.commit()
+    return bool(deleted)
+
+
+def _before(created_col, id_col, cursor):
+    ts, pid = cursor
+    return or_(created_col < ts, and_(created_col == ts, id_col < pid))
+
+
+def timeline(user_id, cursor=None, limit=FEED_PAGE):
+    """Страница ленты: (посты с загруженными авторами, курсор следующей страницы или None)."""
+    after = decode_cursor(cursor) if cursor else None
+
+    q = (db.session.query(TimelineEntry.post_id, TimelineEntry.created_at)
+         .filter(TimelineEntry.user_id == user_id))
+    if after:
+        q = q.filter(_before(TimelineEntry.created_at, TimelineEntry.post_id, after))
+    keys = {pid: ts for pid, ts in q.order_by(TimelineEntry.created_at.desc(), TimelineEntry.post_id.desc()).limit(limit + 1)}
+
+    # посты без fan-out читаем напрямую; их мало, поэтому идём по индексу (fanned_out, created_at, id)
+    q = (db.session.query(Post.id, Post.created_at)
+         .filter(Post.fanned_out == db.false(),
+                 Post.user_id.in_(db.session.query(Follow.followee_id).filter(Follow.follower_id == user_id))))
+    if after:
+        q = q.filter(_before(Post.created_at, Post.id, after))
+    keys.update(q.order_by(Post.created_at.desc(), Post.id.desc()).limit(limit + 1))
+
+    ordered = sorted(keys.items(), key=lambda kv: (kv[1], kv[0]), reverse=True)
+    page = ordered[:limit]
+    by_id = {p.id: p for p in Post.query.options(joinedload(Post.user)).filter(Post.id.in_([pid for pid, _ in page]))} if page else {}
+    posts = [by_id[pid] for pid, _ in page if pid in by_id]
+    next_cursor = encode_cursor(page[-1][1], page[-1][0]) if len(ordered) > limit else None
+    return posts, next_cursor
@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+
+TRANSLIT_TABLE = {'а':'a','б':'b','в':'v','г':'g','д':'d','е':'e','ё':'e','ж':'zh','з':'z','и':'i','й':'y','к':'k','л':'l','м':'m','н':'n','о':'o','п':'p','р':'r','с':'s','т':'t','у':'u','ф':'f','х':'h','ц':'c','ч':'ch','ш':'sh','щ':'sch','ъ':'','ы':'y','ь':'','э':'e','ю':'yu','я':'ya'}
+
+def translit(s):
+    return ''.join(TRANSLIT_TABLE.get(ch, ch) for ch in (s or '').lower())
@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Переводы интерфейса.
+
+Каталоги лежат в ``i18n/<язык>.json`` и читаются один раз при старте; новый
+язык — новый файл (правило множественного числа добавляется в ``PLURAL_RULES``).
+Значение — строка или, для ``tn()``, объект с формами {"one", "few", "many",
+"other"}. Строки каталогов считаются доверенным HTML (``<strong>``, ссылки), а
+подставляемые через ``{имя}`` значения экранируются.
+
+``t``/``tn``/``lang``/``theme`` регистрируются глобалами Jinja один раз, вместо
+context processor'а, который собирал словарь на каждый рендер. Скомпилированные
+шаблоны кэшируются на диске (``JINJA_BYTECODE_CACHE_DIR``) и переживают рестарт.
+"""
+import glob
+import json
+import os
+
+from flask import g
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
+from werkzeug.local import LocalProxy
+
+
+def _plural_ru(n):
+    if n % 10 == 1 and n % 100 != 11:
+        return "one"
+    if 2 <= n % 10 <= 4 and not 12 <= n % 100 <= 14:
+        return "few"
+    return "many"
+
+
+def _plural_en(n):
+    return "one" if n == 1 else "other"
+
+
+PLURAL_RULES = {"ru": _plural_ru, "en": _plural_en}
+
+
+class Catalog:
+    def __init__(self, lang, messages, fallback=None):
+        self.lang = lang
+        self.plural = PLURAL_RULES.get(lang, _plural_en)
+        self.fallback = fallback
+        # строки сразу оборачиваем в Markup, чтобы не делать этого на каждом вызове
+        self.messages = {k: {form: Markup(s) for form, s in v.items()} if isinstance(v, dict) else Markup(v)
+                         for k, v in messages.items()}
+
+    def _lookup(self, key):
+        msg = self.messages.get(key)
+        if msg is None and self.fallback is not None:
+            return self.fallback._lookup(key)
+        return msg
+
+    def gettext(self, key, **kwargs):
+        msg = self._lookup(key)
+        if msg is None:
+            return key
+        if isinstance(msg, dict):
+            msg = msg.get("other") or next(iter(msg.values()))
+        return msg.format(**kwargs) if kwargs else msg
+
+    def ngettext(self, key, n, **kwargs):
+        forms = self._lookup(key)
+        if forms is None:
+            return key
+        if isinstance(forms, dict):
+            forms = forms.get(self.plural(n)) or forms.get("other") or next(iter(forms.values()))
+        return forms.format(n=n, **kwargs)
+
+
+catalogs = {}
+default_language = "ru"
+
+
+def load(directory, default):
+    """Читает все каталоги; недостающие ключи берутся из языка по умолчанию."""
+    raw = {}
+    for path in sorted(glob.glob(os.path.join(directory, "*.json"))):
+        with open(path, encoding="utf-8") as f:
+            raw[os.path.splitext(os.path.basename(path))[0]] = json.load(f)
+    base = Catalog(default, raw.get(default, {}))
+    return {lang: base if lang == default else Catalog(lang, messages, fallback=base)
+            for lang, messages in raw.items()} or {default: base}
+
+
+def select(lang):
+    """Выставляет язык запроса (g.lang) и его каталог; неизвестный язык -> по умолчанию."""
+    g.lang = lang if lang in catalogs else default_language
+    g.catalog = catalogs[g.lang]
+
+
+def _catalog():
+    return g.get("catalog") or catalogs[default_language]
+
+
+def t(key, **kwargs):
+    return _catalog().gettext(key, **kwargs)
+
+
+def tn(key, n, **kwargs):
+    return _catalog().ngettext(key, n, **kwargs)
+
+
+def init_app(app):
+    global catalogs, default_language
+    cfg = app.config
+    cfg.setdefault("I18N_DIR", os.path.join(app.root_path, "i18n"))
+    cfg.setdefault("DEFAULT_LANGUAGE", "ru")
+    cfg.setdefault("JINJA_BYTECODE_CACHE_DIR", os.path.join(app.instance_path, "jinja-cache"))
+    default_language = cfg["DEFAULT_LANGUAGE"]
+    catalogs = load(cfg["I18N_DIR"], default_language)
+
+    if cfg["JINJA_BYTECODE_CACHE_DIR"]:
+        os.makedirs(cfg["JINJA_BYTECODE_CACHE_DIR"], exist_ok=True)
+        app.jinja_env.bytecode_cache = FileSystemBytecodeCache(cfg["JINJA_BYTECODE_CACHE_DIR"])
+    app.jinja_env.globals.update(
+        t=t,
+        tn=tn,
+        languages=sorted(catalogs),
+        # прокси читают g только тогда, когда шаблон к ним обращается
+        lang=LocalProxy(lambda: g.get("lang", default_language)),
+        theme=LocalProxy(lambda: g.get("theme", "dark")),
+    )
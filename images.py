@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Обработка загруженных изображений (аватары, обложки курсов).
+
+В запросе файл только проверяется по содержимому; поворот по EXIF, удаление
+метаданных и нарезка WebP-вариантов выполняются в фоновом пуле потоков.
+Когда варианты готовы, вызывается ``on_done(user_id, url)`` с URL среднего
+варианта — его и сохраняем в профиле. Остальные варианты получаются заменой
+суффикса (см. ``variant_url``). В имени файла есть хеш исходника
+(``user3_avatar.<hash>-md.webp``), так что новый аватар — это новый URL и
+старые файлы можно кэшировать без срока. Заменённые файлы удаляются не сразу, а
+через ``IMAGE_STALE_GRACE`` секунд: старый URL ещё живёт в кэшах других воркеров
+(шапка, страницы и фрагменты).
+"""
+import collections
+import concurrent.futures
+import glob
+import io
+import logging
+import os
+import re
+import threading
+
+from PIL import Image, ImageOps
+
+from assets import content_hash, versioned
+
+log = logging.getLogger(__name__)
+
+# максимальная сторона варианта в пикселях
+VARIANTS = {
+    "avatars": {"sm": 96, "md": 384},
+    "courses": {"sm": 480, "md": 1280},
+}
+DEFAULT_VARIANT = "md"
+FORMATS = {"PNG", "JPEG", "GIF", "WEBP"}
+DEFAULT_AVATARS = {
+    "student": "/static/img/lion_student.svg",
+    "specialist": "/static/img/lion_teacher.svg",
+}
+VARIANT_RE = re.compile(r"-(?:%s)\.webp$" % "|".join(sorted({v for sizes in VARIANTS.values() for v in sizes})))
+
+
+class ImageRejected(Exception):
+    """Загруженный файл не является поддерживаемым изображением."""
+
+
+def variant_url(url, size):
+    """URL нужного варианта; для старых (необработанных) файлов возвращает исходный URL."""
+    if not url or not VARIANT_RE.search(url):
+        return url
+    return VARIANT_RE.sub(f"-{size}.webp", url)
+
+
+def avatar_url(user=None, size="md"):
+    """Единая точка получения URL аватара (глобальная, доступна во всех view и в API).
+
+    ``size``: "sm" — миниатюра для поиска/чата/шапки, "md" — для страницы профиля.
+    """
+    if not user:
+        return versioned(DEFAULT_AVATARS["student"])
+    if getattr(user, "avatar", None):
+        return variant_url(user.avatar, size)
+    return versioned(DEFAULT_AVATARS.get(getattr(user, "role", None) or "student", DEFAULT_AVATARS["student"]))
+
+
+def validate(data, max_pixels):
+    try:
+        with Image.open(io.BytesIO(data)) as img:
+            if img.format not in FORMATS:
+                raise ImageRejected(img.format)
+            if img.width * img.height > max_pixels:
+                raise ImageRejected("too large")
+            img.verify()
+    except ImageRejected:
+        raise
+    except Exception as exc:  # Pillow бросает разные исключения на битых файлах
+        raise ImageRejected(str(exc)) from exc
+
+
+def render_variants(data, sizes, quality):
+    """Возвращает {вариант: байты WebP}; метаданные (EXIF, ICC, комментарии) не переносятся."""
+    with Image.open(io.BytesIO(data)) as src:
+        img = ImageOps.exif_transpose(src)
+        img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") or "transparency" in img.info else "RGB")
+    out = {}
+    for name, side in sizes.items():
+        v = img.copy()
+        v.thumbnail((side, side), Image.LANCZOS)
+        buf = io.BytesIO()
+        v.save(buf, "WEBP", quality=quality, method=4)
+        out[name] = buf.getvalue()
+    return out
+
+
+class ImagePipeline:
+    def __init__(self, app=None):
+        self._pool = None
+        self._app = None
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._current = {}  # (kind, user_id) -> имена файлов последней загрузки
+        self._key_locks = collections.defaultdict(threading.Lock)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cfg = app.config
+        cfg.setdefault("IMAGE_WORKERS", 2)
+        cfg.setdefault("IMAGE_MAX_PIXELS", 40_000_000)
+        cfg.setdefault("IMAGE_WEBP_QUALITY", 82)
+        # должно быть не меньше HEADER_CACHE_TTL и RESPONSE_CACHE_TTL
+        cfg.setdefault("IMAGE_STALE_GRACE", 900)
+        self._app = app
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=int(cfg["IMAGE_WORKERS"]), thread_name_prefix="images")
+
+    def submit(self, file, kind, user_id, on_done):
+        """Проверяет загрузку и ставит её в очередь на обработку. Бросает ImageRejected."""
+        cfg = self._app.config
+        data = file.read()
+        validate(data, cfg["IMAGE_MAX_PIXELS"])
+        key = (kind, user_id)
+        with self._lock:
+            token = self._latest.get(key, 0) + 1
+            self._latest[key] = token
+        return self._pool.submit(self._process, data, kind, user_id, token, on_done)
+
+    def _remove_stale(self, key, folder, base, keep):
+        """Планирует удаление заменённых файлов по истечении IMAGE_STALE_GRACE."""
+        stale = [path for path in glob.glob(os.path.join(folder, f"{base}[.-]*.webp"))
+                 if os.path.basename(path) not in keep]
+        if stale:
+            timer = threading.Timer(self._app.config["IMAGE_STALE_GRACE"], self._delete, args=(key, stale))
+            timer.daemon = True
+            timer.start()
+
+    def _delete(self, key, paths):
+        with self._key_locks[key]:
+            current = self._current.get(key, ())
+            for path in paths:
+                # тот же файл мог снова стать текущим (повторная загрузка того же изображения)
+                if os.path.basename(path) in current:
+                    continue
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    def _process(self, data, kind, user_id, token, on_done):
+        key = (kind, user_id)
+        try:
+            variants = render_variants(data, VARIANTS[kind], self._app.config["IMAGE_WEBP_QUALITY"])
+            with self._key_locks[key]:
+                # пользователь успел загрузить файл новее — этот результат уже не нужен
+                if self._latest.get(key) != token:
+                    return None
+                folder = os.path.join(self._app.config["UPLOAD_FOLDER"], kind)
+                base = f"user{user_id}_{'avatar' if kind == 'avatars' else 'course'}"
+                stem = f"{base}.{content_hash(data)}"
+                names = {f"{stem}-{name}.webp" for name in variants}
+                for name, blob in variants.items():
+                    path = os.path.join(folder, f"{stem}-{name}.webp")
+                    tmp = path + ".tmp"
+                    with open(tmp, "wb") as fh:
+                        fh.write(blob)
+                    os.replace(tmp, path)
+                url = f"/uploads/{kind}/{stem}-{DEFAULT_VARIANT}.webp"
+                with self._app.app_context():
+                    on_done(user_id, url)
+                self._current[key] = names
+                self._remove_stale(key, folder, base, names)
+                return url
+        except Exception:
+            log.exception("image processing failed for %s", key)
+            return None
+
+
+images = ImagePipeline()
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Замеры запросов: время, SQL, шаблоны, размер ответа.
+
+Включается ``PROFILING_ENABLED=True``; выключенный модуль не вешает ни одного
+обработчика. Для каждого запроса считаются полное время, число и суммарное
+время SQL-запросов (события движка SQLAlchemy), время рендера шаблонов и размер
+ответа. Они отдаются заголовком ``Server-Timing`` (видно во вкладке Network
+браузера) и копятся в счётчиках для ``/metrics`` в текстовом формате Prometheus.
+Счётчики живут в процессе — при нескольких воркерах каждый отдаёт свои.
+
+``PROFILE_SLOW_MS`` дополнительно включает cProfile: запросы медленнее порога
+сохраняются в ``PROFILE_DIR`` (смотреть через ``python -m pstats`` или snakeviz).
+cProfile заметно замедляет код, поэтому порог по умолчанию выключен.
+"""
+import cProfile
+import os
+import threading
+import time
+
+from flask import Response, g, request, before_render_template, template_rendered
+from sqlalchemy import event
+
+from models import db
+
+# границы гистограммы времени запроса, секунды
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class Metrics:
+    """Накопительные счётчики по эндпоинтам."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = {}    # (endpoint, method, status) -> count
+        self.endpoints = {}   # endpoint -> [buckets..., sum, count, sql_queries, sql_seconds, template_seconds, bytes]
+
+    def observe(self, endpoint, method, status, seconds, sql_queries, sql_seconds, template_seconds, size):
+        with self._lock:
+            key = (endpoint, method, status)
+            self.requests[key] = self.requests.get(key, 0) + 1
+            row = self.endpoints.get(endpoint)
+            if row is None:
+                row = self.endpoints[endpoint] = [0] * (len(BUCKETS) + 6)
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    row[i] += 1
+            n = len(BUCKETS)
+            row[n] += seconds
+            row[n + 1] += 1
+            row[n + 2] += sql_queries
+            row[n + 3] += sql_seconds
+            row[n + 4] += template_seconds
+            row[n + 5] += size
+
+    def render(self):
+        """Текстовый формат Prometheus (exposition format 0.0.4)."""
+        with self._lock:
+            requests = dict(self.requests)
+            endpoints = {k: list(v) for k, v in self.endpoints.items()}
+        n = len(BUCKETS)
+        out = ["# HELP trilink_requests_total HTTP requests processed.", "# TYPE trilink_requests_total counter"]
+        for (endpoint, method, status), count in sorted(requests.items()):
+            out.append(f'trilink_requests_total{{endpoint="{endpoint}",method="{method}",status="{status}"}} {count}')
+        out += ["# HELP trilink_request_duration_seconds Request wall time.", "# TYPE trilink_request_duration_seconds histogram"]
+        for endpoint, row in sorted(endpoints.items()):
+            for bound, count in zip(BUCKETS, row):
+                out.append(f'trilink_request_duration_seconds_bucket{{endpoint="{endpoint}",le="{bound}"}} {count}')
+            out.append(f'trilink_request_duration_seconds_bucket{{endpoint="{endpoint}",le="+Inf"}} {row[n + 1]}')
+            out.append(f'trilink_request_duration_seconds_sum{{endpoint="{endpoint}"}} {row[n]:.6f}')
+            out.append(f'trilink_request_duration_seconds_count{{endpoint="{endpoint}"}} {row[n + 1]}')
+        for name, idx, kind, help_ in (
+            ("trilink_sql_queries_total", n + 2, "counter", "SQL statements executed."),
+            ("trilink_sql_seconds_total", n + 3, "counter", "Time spent in SQL statements."),
+            ("trilink_template_seconds_total", n + 4, "counter", "Time spent rendering templates."),
+            ("trilink_response_bytes_total", n + 5, "counter", "Response body bytes (non-streaming responses)."),
+        ):
+            out += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+            for endpoint, row in sorted(endpoints.items()):
+                value = row[idx]
+                out.append(f'{name}{{endpoint="{endpoint}"}} {value:.6f}' if isinstance(value, float) else f'{name}{{endpoint="{endpoint}"}} {value}')
+        return "\n".join(out) + "\n"
+
+
+metrics = Metrics()
+
+
+class _Stats:
+    __slots__ = ("start", "sql_queries", "sql_seconds", "template_seconds", "template_depth", "template_start", "profiler")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_queries = 0
+        self.sql_seconds = 0.0
+        self.template_seconds = 0.0
+        self.template_depth = 0
+        self.template_start = 0.0
+        self.profiler = None
+
+
+def _stats():
+    # SQL выполняется и вне запросов (CLI, фоновые потоки) — там g недоступен
+    try:
+        return g.get("_instrumentation")
+    except RuntimeError:
+        return None
+
+
+def _install_sql_events(app):
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("_query_start", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        started = conn.info["_query_start"].pop()
+        stats = _stats()
+        if stats is not None:
+            stats.sql_queries += 1
+            stats.sql_seconds += time.perf_counter() - started
+
+
+def _install_template_signals(app):
+    def before(sender, template, context, **extra):
+        stats = _stats()
+        if stats is not None:
+            # учитываем только внешний рендер, вложенные уже входят в его время
+            if stats.template_depth == 0:
+                stats.template_start = time.perf_counter()
+            stats.template_depth += 1
+
+    def rendered(sender, template, context, **extra):
+        stats = _stats()
+        if stats is not None and stats.template_depth:
+            stats.template_depth -= 1
+            if stats.template_depth == 0:
+                stats.template_seconds += time.perf_counter() - stats.template_start
+
+    before_render_template.connect(before, app, weak=False)
+    template_rendered.connect(rendered, app, weak=False)
+
+
+def _dump_profile(app, profiler, seconds):
+    directory = app.config["PROFILE_DIR"]
+    os.makedirs(directory, exist_ok=True)
+    name = f"{time.strftime('%Y%m%d-%H%M%S')}-{int(seconds * 1000)}ms-{request.endpoint or 'unknown'}-{os.getpid()}.prof"
+    profiler.dump_stats(os.path.join(directory, name))
+    app.logger.info("slow request %s %s: %.0f ms, profile %s", request.method, request.path, seconds * 1000, name)
+
+
+def init_app(app):
+    cfg = app.config
+    cfg.setdefault("PROFILING_ENABLED", False)
+    cfg.setdefault("PROFILE_SLOW_MS", None)
+    cfg.setdefault("PROFILE_DIR", os.path.join(app.instance_path, "profiles"))
+    if not cfg["PROFILING_ENABLED"]:
+        return
+    slow_ms = cfg["PROFILE_SLOW_MS"]
+
+    _install_sql_events(app)
+    _install_template_signals(app)
+
+    @app.before_request
+    def _start():
+        stats = g._instrumentation = _Stats()
+        if slow_ms is not None:
+            profiler = cProfile.Profile()
+            try:
+                profiler.enable()
+            except ValueError:
+                # в процессе может работать только один профилировщик — параллельный запрос пропускаем
+                return
+            stats.profiler = profiler
+
+    @app.after_request
+    def _finish(resp):
+        stats = g.pop("_instrumentation", None)
+        if stats is None:
+            return resp
+        if stats.profiler is not None:
+            stats.profiler.disable()
+        seconds = time.perf_counter() - stats.start
+        size = 0 if resp.is_streamed else (resp.content_length or 0)
+        resp.headers.add("Server-Timing", (
+            f'app;dur={seconds * 1000:.1f}, '
+            f'db;dur={stats.sql_seconds * 1000:.1f};desc="{stats.sql_queries} queries", '
+            f'tpl;dur={stats.template_seconds * 1000:.1f}'))
+        metrics.observe(request.endpoint or "unknown", request.method, resp.status_code, seconds,
+                        stats.sql_queries, stats.sql_seconds, stats.template_seconds, size)
+        if stats.profiler is not None and seconds * 1000 >= slow_ms:
+            _dump_profile(app, stats.profiler, seconds)
+        return resp
+
+    @app.route("/metrics")
+    def metrics_endpoint():
+        return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
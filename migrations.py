@@ -0,0 +1,213 @@
+# -*- coding: utf-8 -*-
+"""Версионные миграции схемы.
+
+Применённые версии записываются в таблицу ``schema_version``. При старте
+процесса выполняется один запрос ``SELECT MAX(version)``; если база уже на
+последней версии, больше ничего не происходит. Новая пустая база создаётся
+через ``create_all()`` и затем прогоняется по всем миграциям — каждая из них
+идемпотентна, так что то же самое безопасно и для старой базы без таблицы версий.
+
+Новая миграция — функция ``fn(conn)`` с декоратором ``@migration(N, "описание")``
+с номером больше последнего; уже выпущенные миграции не редактируются.
+"""
+import datetime
+import logging
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import chat
+import feed
+import search_index
+import tags
+from models import db, Follow, TimelineEntry, Tag, UserTag, WebSession
+
+log = logging.getLogger(__name__)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    def register(fn):
+        assert not MIGRATIONS or MIGRATIONS[-1][0] < version, "миграции должны идти по возрастанию версий"
+        MIGRATIONS.append((version, description, fn))
+        return fn
+    return register
+
+
+def latest_version():
+    return MIGRATIONS[-1][0] if MIGRATIONS else 0
+
+
+def _columns(conn, table):
+    return {col["name"] for col in inspect(conn).get_columns(table)}
+
+
+def _add_columns(conn, table, columns):
+    """Добавляет отсутствующие колонки; возвращает имена добавленных."""
+    existing = _columns(conn, table)
+    added = []
+    for name, ddl in columns:
+        if name not in existing:
+            # Экранируем имя таблицы — "user" зарезервировано в PostgreSQL
+            conn.exec_driver_sql(f'ALTER TABLE "{table}" ADD COLUMN {name} {ddl}')
+            added.append(name)
+    return added
+
+
+# ---------- Миграции ----------
+@migration(1, "user: age, education, graduation_year, course_image")
+def _user_profile_columns(conn):
+    _add_columns(conn, "user", [
+        ("age", "INTEGER"),
+        ("education", "VARCHAR(255)"),
+        ("graduation_year", "VARCHAR(10)"),
+        ("course_image", "VARCHAR(255)"),
+    ])
+
+
+@migration(2, "conversation summary: last message, activity time, unread counters")
+def _conversation_summary(conn):
+    added = _add_columns(conn, "conversation", [("last_message_id", "INTEGER"), ("last_activity_at", "TIMESTAMP")])
+    added += _add_columns(conn, "conversation_member", [
+        ("last_activity_at", "TIMESTAMP"),
+        ("unread_count", "INTEGER NOT NULL DEFAULT 0"),
+    ])
+    if added:
+        conn.exec_driver_sql(
+            'UPDATE conversation SET '
+            'last_message_id = (SELECT MAX(m.id) FROM message m WHERE m.conversation_id = conversation.id), '
+            'last_activity_at = COALESCE((SELECT MAX(m.created_at) FROM message m WHERE m.conversation_id = conversation.id), created_at)')
+        conn.exec_driver_sql(
+            'UPDATE conversation_member SET last_activity_at = '
+            '(SELECT c.last_activity_at FROM conversation c WHERE c.id = conversation_member.conversation_id)')
+
+
+@migration(3, "conversation: canonical pair key with unique index")
+def _conversation_pair_key(conn):
+    if _add_columns(conn, "conversation", [("pair_low", "INTEGER"), ("pair_high", "INTEGER")]):
+        chat.merge_duplicate_pairs(conn)
+        # после слияния дублей сводка у оставшихся диалогов могла устареть
+        conn.exec_driver_sql(
+            'UPDATE conversation SET '
+            'last_message_id = (SELECT MAX(m.id) FROM message m WHERE m.conversation_id = conversation.id), '
+            'last_activity_at = COALESCE((SELECT MAX(m.created_at) FROM message m WHERE m.conversation_id = conversation.id), created_at)')
+    conn.exec_driver_sql("CREATE UNIQUE INDEX IF NOT EXISTS ux_conversation_pair ON conversation (pair_low, pair_high)")
+
+
+@migration(4, "performance indexes: message timeline, inbox, post and user listings")
+def _performance_indexes(conn):
+    for stmt in (
+        "CREATE INDEX IF NOT EXISTS ix_message_timeline ON message (conversation_id, created_at, id)",
+        "CREATE INDEX IF NOT EXISTS ix_conversation_member_inbox ON conversation_member (user_id, last_activity_at, conversation_id)",
+        "CREATE INDEX IF NOT EXISTS ix_conversation_member_conversation_id ON conversation_member (conversation_id)",
+        "CREATE INDEX IF NOT EXISTS ix_post_author_timeline ON post (user_id, created_at, id)",
+        'CREATE INDEX IF NOT EXISTS ix_user_created ON "user" (created_at, id)',
+    ):
+        conn.exec_driver_sql(stmt)
+
+
+@migration(5, "FTS5 people search index (SQLite only)")
+def _people_search(conn):
+    if conn.dialect.name == "sqlite":
+        search_index.create_index(conn)
+
+
+@migration(6, "feed: follow, timeline_entry, user.follower_count")
+def _feed_tables(conn):
+    Follow.__table__.create(conn, checkfirst=True)
+    TimelineEntry.__table__.create(conn, checkfirst=True)
+    _add_columns(conn, "user", [("follower_count", "INTEGER NOT NULL DEFAULT 0")])
+    # уже опубликованные посты попадают хотя бы в ленту своего автора
+    conn.exec_driver_sql(
+        "INSERT INTO timeline_entry (user_id, post_id, author_id, created_at) "
+        "SELECT p.user_id, p.id, p.user_id, COALESCE(p.created_at, CURRENT_TIMESTAMP) FROM post p "
+        "WHERE NOT EXISTS (SELECT 1 FROM timeline_entry t WHERE t.user_id = p.user_id AND t.post_id = p.id)")
+
+
+@migration(7, "tag, user_tag: inverted tag index for recommendations")
+def _tag_index(conn):
+    Tag.__table__.create(conn, checkfirst=True)
+    UserTag.__table__.create(conn, checkfirst=True)
+    tags.create_index(conn)
+
+
+@migration(8, "web_session: server-side sessions")
+def _web_sessions(conn):
+    WebSession.__table__.create(conn, checkfirst=True)
+
+
+@migration(9, "post.fanned_out: posts left out of follower timelines")
+def _post_fanout_flag(conn):
+    if _add_columns(conn, "post", [("fanned_out", "BOOLEAN NOT NULL DEFAULT TRUE")]):
+        # посты нынешних «знаменитостей» могли не попасть в ленты — помечаем их все, лишнее отсеется при чтении
+        conn.execute(text('UPDATE post SET fanned_out = FALSE WHERE user_id IN '
+                          '(SELECT id FROM "user" WHERE follower_count > :limit)'), {"limit": feed.fanout_limit()})
+    conn.exec_driver_sql("CREATE INDEX IF NOT EXISTS ix_post_fanout ON post (fanned_out, created_at, id)")
+
+
+# ---------- Запуск ----------
+def current_version(engine):
+    """Версия схемы или None, если таблицы версий ещё нет."""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT MAX(version) FROM schema_version")).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return None
+
+
+def upgrade():
+    """Применяет недостающие миграции. Вызывается в app context; возвращает число применённых."""
+    engine = db.engine
+    current = current_version(engine)
+    if current is not None and current >= latest_version():
+        return 0
+    if current is None:
+        with engine.begin() as conn:
+            fresh = not inspect(conn).has_table("user")
+            conn.exec_driver_sql(
+                "CREATE TABLE IF NOT EXISTS schema_version ("
+                "version INTEGER PRIMARY KEY, description VARCHAR(255), applied_at TIMESTAMP)")
+            if fresh:
+                db.metadata.create_all(conn)
+        current = 0
+    applied = 0
+    for version, description, fn in MIGRATIONS:
+        if version <= current:
+            continue
+        with engine.begin() as conn:
+            fn(conn)
+            conn.execute(text("INSERT INTO schema_version (version, description, applied_at) VALUES (:v, :d, :t)"),
+                         {"v": version, "d": description, "t": datetime.datetime.utcnow()})
+        log.info("applied migration %s: %s", version, description)
+        applied += 1
+    return applied
+
+
+def init_app(app):
+    app.config.setdefault("AUTO_MIGRATE", True)
+    with app.app_context():
+        if app.config["AUTO_MIGRATE"]:
+            upgrade()
+        elif (current_version(db.engine) or 0) < latest_version():
+            app.logger.warning("Схема БД устарела — выполните `flask db-upgrade`.")
+    app.cli.add_command(db_upgrade_command)
+    app.cli.add_command(db_version_command)
+
+
+@click.command("db-upgrade")
+@with_appcontext
+def db_upgrade_command():
+    """Применить недостающие миграции схемы."""
+    click.echo(f"Применено миграций: {upgrade()}; версия схемы: {current_version(db.engine)}")
+
+
+@click.command("db-version")
+@with_appcontext
+def db_version_command():
+    """Показать текущую и последнюю версии схемы."""
+    click.echo(f"Текущая версия: {current_version(db.engine)}; последняя: {latest_version()}")
+    for version, description, _ in MIGRATIONS:
+        click.echo(f"  {version}: {description}")
@@ -0,0 +1,145 @@
+# -*- coding: utf-8 -*-
+import datetime
+from flask_sqlalchemy import SQLAlchemy
+
+db = SQLAlchemy()
+
+# ---------- Модели ----------
+class User(db.Model):
+    __table_args__ = (
+        db.Index("ix_user_created", "created_at", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    email = db.Column(db.String(255), unique=True, nullable=False)
+    password_hash = db.Column(db.String(255), nullable=False)
+    role = db.Column(db.String(20), nullable=False, default="student")
+    age = db.Column(db.Integer)
+    first_name = db.Column(db.String(120))
+    last_name = db.Column(db.String(120))
+    nickname = db.Column(db.String(120), unique=True)
+    avatar = db.Column(db.String(255))
+    age = db.Column(db.Integer)
+    education = db.Column(db.String(255))
+    graduation_year = db.Column(db.String(10))
+    course_image = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # денормализованный счётчик подписчиков — по нему лента выбирает fan-out или чтение «на лету»
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+    student = db.relationship("StudentProfile", backref="user", uselist=False, cascade="all, delete-orphan")
+    specialist = db.relationship("SpecialistProfile", backref="user", uselist=False, cascade="all, delete-orphan")
+    posts = db.relationship("Post", backref="user", lazy=True, cascade="all, delete-orphan")
+
+class StudentProfile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, unique=True)
+    looking_for = db.Column(db.Text)
+
+class SpecialistProfile(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False, unique=True)
+    education_degree = db.Column(db.String(120))
+    workplace = db.Column(db.String(255))
+    keywords = db.Column(db.Text)
+
+class Post(db.Model):
+    __table_args__ = (
+        db.Index("ix_post_author_timeline", "user_id", "created_at", "id"),
+        db.Index("ix_post_fanout", "fanned_out", "created_at", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    title = db.Column(db.String(255))
+    summary = db.Column(db.Text)
+    image = db.Column(db.String(255))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    # False — пост не разложен по лентам подписчиков (автор был выше FEED_FANOUT_LIMIT)
+    fanned_out = db.Column(db.Boolean, nullable=False, default=True, server_default=db.true())
+
+class Conversation(db.Model):
+    __table_args__ = (
+        # канонический ключ личного диалога: (min(user_id), max(user_id))
+        db.Index("ux_conversation_pair", "pair_low", "pair_high", unique=True),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    pair_low = db.Column(db.Integer)
+    pair_high = db.Column(db.Integer)
+    # денормализованная сводка, обновляется при записи сообщения (chat.post_message)
+    last_message_id = db.Column(db.Integer)
+    last_activity_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class ConversationMember(db.Model):
+    __table_args__ = (
+        db.Index("ix_conversation_member_inbox", "user_id", "last_activity_at", "conversation_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=False, index=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    # копия Conversation.last_activity_at — чтобы список диалогов читался одним проходом по индексу
+    last_activity_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+    unread_count = db.Column(db.Integer, nullable=False, default=0, server_default="0")
+
+class Message(db.Model):
+    __table_args__ = (
+        db.Index("ix_message_timeline", "conversation_id", "created_at", "id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    conversation_id = db.Column(db.Integer, db.ForeignKey("conversation.id"), nullable=False)
+    sender_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    text = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class Follow(db.Model):
+    __table_args__ = (
+        db.UniqueConstraint("follower_id", "followee_id", name="ux_follow_pair"),
+        db.Index("ix_follow_followee", "followee_id", "follower_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    follower_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    followee_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.datetime.utcnow)
+
+class TimelineEntry(db.Model):
+    """Пост в ленте конкретного читателя (fan-out при публикации)."""
+    __table_args__ = (
+        db.UniqueConstraint("user_id", "post_id", name="ux_timeline_post"),
+        db.Index("ix_timeline_reader", "user_id", "created_at", "post_id"),
+    )
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    post_id = db.Column(db.Integer, db.ForeignKey("post.id"), nullable=False)
+    author_id = db.Column(db.Integer, db.ForeignKey("user.id"), nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False)
+
+class Tag(db.Model):
+    """Нормализованный тег: нижний регистр, латиница (см. helpers.translit)."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), unique=True, nullable=False)
+
+class UserTag(db.Model):
+    """Обратный индекс тегов: kind='offer' — специалист ведёт, kind='seek' — ученик ищет."""
+    __table_args__ = (
+        db.Index("ix_user_tag_inverted", "tag_id", "kind", "user_id"),
+    )
+    user_id = db.Column(db.Integer, db.ForeignKey("user.id"), primary_key=True)
+    kind = db.Column(db.String(8), primary_key=True)
+    tag_id = db.Column(db.Integer, db.ForeignKey("tag.id"), primary_key=True)
+
+class WebSession(db.Model):
+    """Серверная сессия: в cookie только случайный токен, здесь — его sha256 и данные."""
+    __tablename__ = "web_session"
+    id = db.Column(db.String(64), primary_key=True)
+    data = db.Column(db.Text, nullable=False)
+    user_id = db.Column(db.Integer, index=True)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+def touched_user_ids(session):
+    """id пользователей, чьи User/StudentProfile/SpecialistProfile изменены в текущем flush."""
+    ids = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            ids.add(obj.id)
+        elif isinstance(obj, (StudentProfile, SpecialistProfile)):
+            ids.add(obj.user_id if obj.user_id is not None else getattr(obj.user, "id", None))
+    ids.discard(None)
+    return ids
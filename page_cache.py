@@ -0,0 +1,115 @@
+# -*- coding: utf-8 -*-
+"""Кэш готовых страниц и фрагментов шаблонов.
+
+Страницы для анонимов (вход, регистрация) зависят только от адреса, языка и
+темы — их тело кэшируется целиком, пока в сессии нет пользователя, флеш-сообщений
+и незавершённой регистрации. Части страниц, зависящие от редко меняющейся
+сущности (карточка профиля), кэшируются фрагментами с ключом по версии сущности;
+версию сбрасывает ``bump()`` из путей сохранения профиля. Так же через ``value()``
+кэшируются и данные не-HTML (рекомендации).
+
+Бэкенд задаётся ``RESPONSE_CACHE_BACKEND``: "memory" (по умолчанию, на процесс),
+"file" (каталог ``RESPONSE_CACHE_DIR``, общий для воркеров; удобно держать в
+/dev/shm) или "null".
+"""
+import os
+import uuid
+from functools import wraps
+
+import click
+from flask import Response, g, make_response, request, session
+from markupsafe import Markup
+
+from cache import make_cache, NullCache
+
+
+class PageCache:
+    def __init__(self):
+        self.backend = NullCache()
+        self.prefix = ""
+        self.ttl = 0
+
+    def init_app(self, app):
+        cfg = app.config
+        cfg.setdefault("RESPONSE_CACHE_BACKEND", "memory")
+        cfg.setdefault("RESPONSE_CACHE_DIR", os.path.join(app.instance_path, "page-cache"))
+        cfg.setdefault("RESPONSE_CACHE_MAXSIZE", 5000)
+        cfg.setdefault("RESPONSE_CACHE_TTL", 300)
+        # для file-бэкенда меняйте при выкладке, чтобы не отдавать страницы со старыми ссылками на статику
+        cfg.setdefault("RESPONSE_CACHE_PREFIX", "")
+        self.ttl = cfg["RESPONSE_CACHE_TTL"]
+        self.prefix = cfg["RESPONSE_CACHE_PREFIX"]
+        self.backend = make_cache(cfg["RESPONSE_CACHE_BACKEND"], maxsize=cfg["RESPONSE_CACHE_MAXSIZE"],
+                                  ttl=self.ttl, directory=cfg["RESPONSE_CACHE_DIR"])
+        app.cli.add_command(cache_clear_command)
+
+    # ---------- Версии сущностей ----------
+    def version(self, kind, ident):
+        return self.backend.get((self.prefix, "ver", kind, ident), "0")
+
+    def bump(self, kind, ident):
+        """Делает недействительными все фрагменты сущности (во всех процессах для file-бэкенда)."""
+        # версия живёт дольше фрагментов: когда она вытесняется, старые фрагменты уже истекли
+        self.backend.set((self.prefix, "ver", kind, ident), uuid.uuid4().hex, ttl=self.ttl * 4 or None)
+
+    # ---------- Страницы ----------
+    @staticmethod
+    def _personal():
+        return bool(session.get("user_id") or session.get("_flashes") or session.get("pending_user"))
+
+    def page(self, view):
+        """Декоратор для GET-страниц, одинаковых для всех анонимов с тем же языком и темой."""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != "GET" or self._personal():
+                return view(*args, **kwargs)
+            key = (self.prefix, "page", request.full_path, g.lang, g.theme)
+            hit = self.backend.get(key)
+            if hit is not None:
+                body, mimetype = hit
+                resp = Response(body, mimetype=mimetype)
+                resp.headers["X-Cache"] = "HIT"
+                return resp
+            resp = make_response(view(*args, **kwargs))
+            # страница могла сама положить что-то личное в сессию (флеш, pending_user)
+            if resp.status_code == 200 and not resp.direct_passthrough and not self._personal():
+                self.backend.set(key, (resp.get_data(), resp.mimetype))
+                resp.headers["X-Cache"] = "MISS"
+            return resp
+        return wrapper
+
+    # ---------- Фрагменты ----------
+    def fragment(self, name, kind, ident, render):
+        """HTML фрагмента ``name`` для сущности (kind, ident); ``render()`` вызывается только при промахе."""
+        key = (self.prefix, "frag", name, kind, ident, self.version(kind, ident), g.lang, g.theme)
+        html = self.backend.get(key)
+        if html is None:
+            html = str(render())
+            self.backend.set(key, html)
+        return Markup(html)
+
+    # ---------- Произвольные значения ----------
+    def value(self, name, ident, versions, compute):
+        """Значение ``name`` для ``ident`` с ключом по версиям сущностей [(kind, ident), ...].
+
+        ``compute()`` вызывается только при промахе; ``bump()`` любой из сущностей сбрасывает значение.
+        """
+        key = (self.prefix, "value", name, ident) + tuple(self.version(k, i) for k, i in versions)
+        hit = self.backend.get(key)
+        if hit is None:
+            hit = compute()
+            self.backend.set(key, hit)
+        return hit
+
+    def clear(self):
+        self.backend.clear()
+
+
+pages = PageCache()
+
+
+@click.command("cache-clear")
+def cache_clear_command():
+    """Очистить кэш страниц и фрагментов."""
+    pages.clear()
+    click.echo("Кэш страниц очищен.")
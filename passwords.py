@@ -0,0 +1,114 @@
+# -*- coding: utf-8 -*-
+"""Хеширование паролей argon2 с ограниченной параллельностью.
+
+Хеши считаются в отдельном пуле из ``PASSWORD_HASH_WORKERS`` потоков (argon2-cffi
+отпускает GIL), а число ожидающих запросов ограничено семафором. Так волна
+логинов занимает не больше заданного числа ядер и не отнимает потоки у
+остальных страниц: если очередь переполнена, вызывающий получает HashingBusy.
+"""
+import concurrent.futures
+import threading
+import time
+
+import click
+from flask import current_app
+from flask.cli import with_appcontext
+from passlib.hash import argon2
+
+
+class HashingBusy(Exception):
+    """Пул хеширования перегружен: слот не освободился за PASSWORD_HASH_TIMEOUT."""
+
+
+def make_hasher(time_cost, memory_cost, parallelism):
+    return argon2.using(rounds=time_cost, memory_cost=memory_cost, parallelism=parallelism)
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self._hasher = argon2
+        self._pool = None
+        self._slots = None
+        self.wait_timeout = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        cfg = app.config
+        cfg.setdefault("ARGON2_TIME_COST", 3)
+        cfg.setdefault("ARGON2_MEMORY_COST", 65536)  # KiB
+        cfg.setdefault("ARGON2_PARALLELISM", 4)
+        cfg.setdefault("PASSWORD_HASH_WORKERS", 2)
+        cfg.setdefault("PASSWORD_HASH_QUEUE", 16)
+        cfg.setdefault("PASSWORD_HASH_TIMEOUT", 10)
+        self._hasher = make_hasher(cfg["ARGON2_TIME_COST"], cfg["ARGON2_MEMORY_COST"], cfg["ARGON2_PARALLELISM"])
+        workers = int(cfg["PASSWORD_HASH_WORKERS"])
+        self._pool = concurrent.futures.ThreadPoolExecutor(max_workers=workers, thread_name_prefix="argon2")
+        # выполняются workers задач, ещё PASSWORD_HASH_QUEUE ждут в очереди пула
+        self._slots = threading.BoundedSemaphore(workers + int(cfg["PASSWORD_HASH_QUEUE"]))
+        self.wait_timeout = cfg["PASSWORD_HASH_TIMEOUT"]
+        app.cli.add_command(hash_bench_command)
+
+    def _run(self, fn, *args):
+        if self._pool is None:
+            return fn(*args)
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            raise HashingBusy()
+        try:
+            return self._pool.submit(fn, *args).result()
+        finally:
+            self._slots.release()
+
+    def hash(self, password):
+        return self._run(self._hasher.hash, password)
+
+    def verify(self, password, hash_):
+        return self._run(self._hasher.verify, password, hash_)
+
+    def needs_update(self, hash_):
+        """True, если хеш посчитан с параметрами, отличными от текущих настроек."""
+        return self._hasher.needs_update(hash_)
+
+
+passwords = PasswordHasher()
+
+
+def benchmark(hasher, seconds=2.0, threads=1):
+    """Возвращает число хешей в секунду для ``hasher`` при ``threads`` параллельных потоках."""
+    deadline = time.perf_counter() + seconds
+    counts = [0] * threads
+
+    def worker(i):
+        while time.perf_counter() < deadline:
+            hasher.hash("benchmark-password")
+            counts[i] += 1
+
+    started = time.perf_counter()
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for t in pool:
+        t.start()
+    for t in pool:
+        t.join()
+    return sum(counts) / (time.perf_counter() - started)
+
+
+@click.command("hash-bench")
+@click.option("--seconds", default=2.0, show_default=True, help="Длительность замера на один набор параметров.")
+@click.option("--threads", default=0, help="Число потоков (по умолчанию PASSWORD_HASH_WORKERS).")
+@click.option("--grid", is_flag=True, help="Кроме текущих параметров замерить соседние значения time/memory cost.")
+@with_appcontext
+def hash_bench_command(seconds, threads, grid):
+    """Замерить скорость argon2 (хешей/с) для текущих и соседних параметров."""
+    cfg = current_app.config
+    threads = threads or int(cfg["PASSWORD_HASH_WORKERS"])
+    t, m, p = cfg["ARGON2_TIME_COST"], cfg["ARGON2_MEMORY_COST"], cfg["ARGON2_PARALLELISM"]
+    param_sets = [(t, m, p)]
+    if grid:
+        param_sets += [(tc, mc, p) for tc in (max(1, t - 1), t, t + 1) for mc in (m // 2, m, m * 2) if (tc, mc) != (t, m)]
+    for tc, mc, pc in param_sets:
+        hasher = make_hasher(tc, mc, pc)
+        single = benchmark(hasher, seconds, 1)
+        line = f"time_cost={tc} memory_cost={mc} parallelism={pc}: {single:.1f} hash/s (1 поток)"
+        if threads > 1:
+            line += f", {benchmark(hasher, seconds, threads):.1f} hash/s ({threads} потоков)"
+        click.echo(line)
@@ -0,0 +1,56 @@
+# -*- coding: utf-8 -*-
+"""In-process pub/sub для доставки сообщений чата без перезагрузки страницы.
+
+Каждый открытый поток (SSE или long-poll) получает свою очередь; запись
+сообщения публикует его во все очереди диалога. Брокер живёт внутри процесса,
+поэтому работает под многопоточным dev-сервером Flask; между разными
+процессами сообщения догоняются периодической проверкой базы в самом потоке.
+"""
+import collections
+import json
+import queue
+import threading
+
+QUEUE_SIZE = 100
+
+
+class Broker:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subs = collections.defaultdict(set)
+
+    def subscribe(self, channel):
+        q = queue.Queue(maxsize=QUEUE_SIZE)
+        with self._lock:
+            self._subs[channel].add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self._lock:
+            subs = self._subs.get(channel)
+            if subs is not None:
+                subs.discard(q)
+                if not subs:
+                    del self._subs[channel]
+
+    def publish(self, channel, payload):
+        with self._lock:
+            subs = list(self._subs.get(channel, ()))
+        for q in subs:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # медленный клиент догонит по after_id при переподключении
+                pass
+
+    def subscribers(self, channel):
+        with self._lock:
+            return len(self._subs.get(channel, ()))
+
+
+broker = Broker()
+
+
+def sse_event(payload, event_id=None):
+    head = f"id: {event_id}\n" if event_id is not None else ""
+    return f"{head}data: {json.dumps(payload, ensure_ascii=False)}\n\n"
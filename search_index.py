@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""Поиск людей по FTS5-индексу.
+
+Индекс ``user_search`` хранит по одному документу на пользователя (rowid = user.id)
+и обновляется в том же транзакционном flush, что и сам профиль. Весь текст
+приводится к латинице через ``translit()``, поэтому «математика» и «matematika»
+находят одно и то же. Для не-SQLite баз остаётся запасной вариант на LIKE.
+"""
+import re
+
+import click
+from sqlalchemy import bindparam, event, or_, text
+from sqlalchemy.orm import Session, selectinload
+
+from helpers import translit
+from models import db, User, StudentProfile, SpecialistProfile, touched_user_ids
+
+PAGE_SIZE = 24
+TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+# веса bm25 по колонкам: name, nickname, role, tags
+RANK = "bm25(user_search, 5.0, 10.0, 1.0, 2.0)"
+ROLE_LABELS = {"student": "ученик", "specialist": "специалист"}
+
+_enabled = False
+
+CREATE_SQL = (
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search "
+    "USING fts5(name, nickname, role, tags, tokenize='unicode61 remove_diacritics 2')"
+)
+DOC_SQL = (
+    'SELECT u.id, u.first_name, u.last_name, u.nickname, u.role, sp.keywords, st.looking_for '
+    'FROM "user" u '
+    'LEFT JOIN specialist_profile sp ON sp.user_id = u.id '
+    'LEFT JOIN student_profile st ON st.user_id = u.id'
+)
+
+
+def normalize(s):
+    return " ".join(TOKEN_RE.findall(translit(s)))
+
+
+def _document(row):
+    uid, first, last, nick, role, keywords, looking_for = row
+    return {
+        "id": uid,
+        "name": normalize(f"{first or ''} {last or ''}"),
+        "nickname": normalize(nick),
+        "role": normalize(f"{role or ''} {ROLE_LABELS.get(role, '')}"),
+        "tags": normalize(f"{keywords or ''} {looking_for or ''}"),
+    }
+
+
+def reindex(conn, user_ids=None):
+    """Перестраивает документы для ``user_ids`` (или для всех пользователей)."""
+    if user_ids is None:
+        conn.execute(text("DELETE FROM user_search"))
+        rows = conn.execute(text(DOC_SQL)).fetchall()
+    else:
+        ids = list(user_ids)
+        if not ids:
+            return
+        conn.execute(text("DELETE FROM user_search WHERE rowid IN :ids").bindparams(bindparam("ids", expanding=True)), {"ids": ids})
+        rows = conn.execute(text(DOC_SQL + " WHERE u.id IN :ids").bindparams(bindparam("ids", expanding=True)), {"ids": ids}).fetchall()
+    if rows:
+        conn.execute(
+            text("INSERT INTO user_search(rowid, name, nickname, role, tags) VALUES (:id, :name, :nickname, :role, :tags)"),
+            [_document(r) for r in rows],
+        )
+
+
+def create_index(conn):
+    """Создаёт FTS-таблицу и заполняет её (вызывается миграцией)."""
+    conn.execute(text(CREATE_SQL))
+    reindex(conn)
+
+
+def refresh(user_ids=None):
+    """Переиндексирует пользователей, записанных в обход ORM flush (пакетный INSERT)."""
+    if _enabled:
+        reindex(db.session.connection(), user_ids)
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_index(session, flush_context):
+    if not _enabled:
+        return
+    ids = touched_user_ids(session)
+    if ids:
+        reindex(session.connection(), ids)
+
+
+def _match_expr(q):
+    nick_only = q.startswith("@")
+    tokens = TOKEN_RE.findall(translit(q.lstrip("@")))
+    if not tokens:
+        return None
+    expr = " ".join(f'"{tok}"*' for tok in tokens)
+    return f"nickname : ({expr})" if nick_only else expr
+
+
+def _with_profiles(query):
+    return query.options(selectinload(User.student), selectinload(User.specialist))
+
+
+def search_people(q, page=1, per_page=PAGE_SIZE):
+    """Возвращает (люди, есть_ли_следующая_страница) для запроса ``q``."""
+    offset = (max(page, 1) - 1) * per_page
+    q = (q or "").strip()
+    if not q.lstrip("@"):
+        people = _with_profiles(User.query.order_by(User.created_at.desc(), User.id.desc())).limit(per_page + 1).offset(offset).all()
+        return people[:per_page], len(people) > per_page
+
+    if _enabled:
+        expr = _match_expr(q)
+        if not expr:
+            return [], False
+        ids = [r[0] for r in db.session.execute(
+            text(f"SELECT rowid FROM user_search WHERE user_search MATCH :q ORDER BY {RANK} LIMIT :limit OFFSET :offset"),
+            {"q": expr, "limit": per_page + 1, "offset": offset},
+        )]
+        by_id = {u.id: u for u in _with_profiles(User.query.filter(User.id.in_(ids[:per_page]))).all()}
+        return [by_id[i] for i in ids[:per_page] if i in by_id], len(ids) > per_page
+
+    pattern = f"%{q.lstrip('@').lower()}%"
+    query = (User.query.outerjoin(StudentProfile).outerjoin(SpecialistProfile)
+             .filter(or_(User.first_name.ilike(pattern), User.last_name.ilike(pattern),
+                         User.nickname.ilike(pattern), User.role.ilike(pattern),
+                         SpecialistProfile.keywords.ilike(pattern), StudentProfile.looking_for.ilike(pattern)))
+             .order_by(User.created_at.desc(), User.id.desc()))
+    people = _with_profiles(query).limit(per_page + 1).offset(offset).all()
+    return people[:per_page], len(people) > per_page
+
+
+def init_app(app):
+    global _enabled
+    # таблицу user_search создаёт миграция; здесь только решаем, пользоваться ли ей
+    with app.app_context():
+        _enabled = db.engine.dialect.name == "sqlite"
+
+    @app.cli.command("reindex-search")
+    def reindex_search_command():
+        """Полностью перестроить поисковый индекс людей."""
+        if not _enabled:
+            click.echo("Поисковый индекс используется только с SQLite.")
+            return
+        with db.engine.begin() as conn:
+            create_index(conn)
+        click.echo("Поисковый индекс перестроен.")
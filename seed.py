@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""Демо-данные и генератор синтетической нагрузки.
+
+``flask seed-demo`` идемпотентно добавляет демо-специалистов с постами одной
+транзакцией. ``flask seed-synthetic`` создаёт N пользователей, диалогов,
+сообщений, подписок и постов пакетными INSERT'ами — чтобы локально
+воспроизвести объёмы продакшена.
+"""
+import datetime
+import random
+
+import click
+from sqlalchemy import func, insert, text
+
+import feed
+import search_index
+import tags
+from helpers import translit
+from models import db, User, StudentProfile, SpecialistProfile, Post, Conversation, ConversationMember, Message, Follow, TimelineEntry
+from passwords import passwords
+
+DEMO_PASSWORD = "Passw0rd!"
+DEMO_USERS = [
+    {"email": "alice@bots.dev", "first_name": "Alice", "last_name": "Johnson", "nickname": "alice-tutor",
+     "keywords": "математика, ЕГЭ", "education_degree": "Магистр", "workplace": "МГУ",
+     "posts": [("Линал: с чего начать", "Сводка тем.")]},
+    {"email": "bob@bots.dev", "first_name": "Bob", "last_name": "Lee", "nickname": "bob-coder",
+     "keywords": "python, алгоритмы", "education_degree": "Магистр", "workplace": "ИТМО",
+     "posts": [("Python: 3 практики", "Заметки для старта.")]},
+]
+
+SYNTHETIC_DOMAIN = "load.test"
+FIRST_NAMES = ["Анна", "Иван", "Мария", "Алексей", "Екатерина", "Дмитрий", "Ольга", "Сергей", "Alice", "Bob", "Maria", "John"]
+LAST_NAMES = ["Иванова", "Петров", "Смирнова", "Кузнецов", "Попова", "Соколов", "Lee", "Smith", "Garcia", "Brown"]
+SUBJECTS = ["математика", "физика", "химия", "биология", "история", "английский", "python", "алгоритмы",
+            "ЕГЭ", "ОГЭ", "олимпиады", "линейная алгебра", "статистика", "русский язык", "java", "дизайн"]
+PHRASES = ["Привет!", "Когда удобно созвониться?", "Спасибо за занятие", "Можно разобрать задачу?",
+           "Отправил домашку", "Давайте в четверг", "Ок", "Посмотрю вечером"]
+CHUNK = 5000
+
+
+def seed_demo():
+    """Добавляет недостающих демо-пользователей. Возвращает число созданных."""
+    emails = [d["email"] for d in DEMO_USERS]
+    existing = {e for (e,) in db.session.query(User.email).filter(User.email.in_(emails))}
+    missing = [d for d in DEMO_USERS if d["email"] not in existing]
+    if not missing:
+        return 0
+    pw_hash = passwords.hash(DEMO_PASSWORD)
+    for d in missing:
+        u = User(email=d["email"], role="specialist", password_hash=pw_hash,
+                 first_name=d["first_name"], last_name=d["last_name"], nickname=d["nickname"])
+        u.specialist = SpecialistProfile(education_degree=d["education_degree"], workplace=d["workplace"], keywords=d["keywords"])
+        db.session.add(u)
+        db.session.flush()
+        for title, summary in d["posts"]:
+            feed.publish(u, title, summary, commit=False)
+    db.session.commit()
+    return len(missing)
+
+
+def _bulk(model, rows):
+    for i in range(0, len(rows), CHUNK):
+        db.session.execute(insert(model), rows[i:i + CHUNK])
+
+
+def _next_id(model):
+    return (db.session.query(func.max(model.id)).scalar() or 0) + 1
+
+
+def _sync_sequences(*models):
+    """Строки с явными id не двигают SERIAL-последовательности PostgreSQL — подтягиваем их к MAX(id)."""
+    if db.engine.dialect.name != "postgresql":
+        return
+    quote = db.engine.dialect.identifier_preparer.quote
+    for model in models:
+        table = quote(model.__table__.name)
+        db.session.execute(text(f"SELECT setval(pg_get_serial_sequence(:table, 'id'), "
+                                f"(SELECT COALESCE(MAX(id), 0) + 1 FROM {table}), false)"), {"table": table})
+
+
+def generate(users, conversations, messages, seed=0, password=DEMO_PASSWORD, follows=0, posts=0):
+    """Создаёт синтетических пользователей, диалоги и сообщения одной транзакцией.
+
+    ``follows`` — подписок на специалистов у каждого ученика, ``posts`` — постов
+    у каждого специалиста; ленты подписчиков заполняются так же, как при fan-out.
+
+    Возвращает id созданных пользователей. Все они получают пароль ``password``.
+    """
+    rnd = random.Random(seed)
+    now = datetime.datetime.utcnow()
+    pw_hash = passwords.hash(password)
+    uid0 = _next_id(User)
+    user_rows, student_rows, specialist_rows = [], [], []
+    for n in range(users):
+        uid = uid0 + n
+        first, last = rnd.choice(FIRST_NAMES), rnd.choice(LAST_NAMES)
+        role = "specialist" if rnd.random() < 0.25 else "student"
+        user_rows.append({
+            "id": uid, "email": f"user{uid}@{SYNTHETIC_DOMAIN}", "password_hash": pw_hash, "role": role,
+            "first_name": first, "last_name": last, "nickname": f"{translit(first)}-{uid}",
+            "created_at": now - datetime.timedelta(minutes=rnd.randrange(525600)),
+        })
+        subjects = ", ".join(rnd.sample(SUBJECTS, rnd.randint(1, 3)))
+        if role == "specialist":
+            specialist_rows.append({"user_id": uid, "keywords": subjects, "education_degree": "Магистр", "workplace": "ВУЗ"})
+        else:
+            student_rows.append({"user_id": uid, "looking_for": subjects})
+    _bulk(User, user_rows)
+    _bulk(StudentProfile, student_rows)
+    _bulk(SpecialistProfile, specialist_rows)
+    user_ids = [r["id"] for r in user_rows]
+
+    # уже существующие пары нельзя создавать повторно (уникальный индекс по паре)
+    taken = set(db.session.query(Conversation.pair_low, Conversation.pair_high).filter(Conversation.pair_low.isnot(None)))
+    pairs = set()
+    attempts = 0
+    while len(pairs) < conversations and len(user_ids) > 1 and attempts < conversations * 10:
+        attempts += 1
+        a, b = rnd.sample(user_ids, 2)
+        pair = (min(a, b), max(a, b))
+        if pair not in taken:
+            pairs.add(pair)
+
+    cid, mid = _next_id(Conversation), _next_id(Message)
+    conv_rows, member_rows, msg_rows = [], [], []
+    for low, high in pairs:
+        started = now - datetime.timedelta(minutes=rnd.randrange(1, 525600))
+        ts, last_id = started, None
+        for _ in range(messages):
+            ts += datetime.timedelta(seconds=rnd.randint(5, 3600))
+            msg_rows.append({"id": mid, "conversation_id": cid, "sender_id": rnd.choice((low, high)),
+                             "text": rnd.choice(PHRASES), "created_at": ts})
+            last_id, mid = mid, mid + 1
+        conv_rows.append({"id": cid, "created_at": started, "pair_low": low, "pair_high": high,
+                          "last_message_id": last_id, "last_activity_at": ts})
+        for uid in (low, high):
+            member_rows.append({"conversation_id": cid, "user_id": uid, "last_activity_at": ts, "unread_count": 0})
+        cid += 1
+    _bulk(Conversation, conv_rows)
+    _bulk(ConversationMember, member_rows)
+    _bulk(Message, msg_rows)
+
+    specialists = [r["user_id"] for r in specialist_rows]
+    followers = {uid: [] for uid in specialists}
+    follow_rows = []
+    for r in student_rows if specialists else []:
+        for sid in rnd.sample(specialists, min(follows, len(specialists))):
+            followers[sid].append(r["user_id"])
+            follow_rows.append({"follower_id": r["user_id"], "followee_id": sid, "created_at": now})
+    pid = _next_id(Post)
+    post_rows, entry_rows = [], []
+    limit = feed.fanout_limit()
+    for sid in specialists:
+        fan_out = len(followers[sid]) <= limit
+        readers = [sid] + (followers[sid] if fan_out else [])
+        for _ in range(posts):
+            ts = now - datetime.timedelta(minutes=rnd.randrange(525600))
+            post_rows.append({"id": pid, "user_id": sid, "title": f"Заметки: {rnd.choice(SUBJECTS)}",
+                              "summary": rnd.choice(PHRASES), "image": "", "created_at": ts,
+                              "fanned_out": fan_out})
+            entry_rows.extend({"user_id": uid, "post_id": pid, "author_id": sid, "created_at": ts} for uid in readers)
+            pid += 1
+    _bulk(Follow, follow_rows)
+    _bulk(Post, post_rows)
+    _bulk(TimelineEntry, entry_rows)
+    for sid, fs in followers.items():
+        if fs:
+            User.query.filter_by(id=sid).update({User.follower_count: len(fs)}, synchronize_session=False)
+
+    _sync_sequences(User, Conversation, Message, Post)
+
+    # пакетные INSERT'ы идут мимо ORM flush, поэтому индексы поиска и тегов обновляем явно
+    search_index.refresh(user_ids)
+    tags.refresh(user_ids)
+    db.session.commit()
+    return user_ids
+
+
+def init_app(app):
+    @app.cli.command("seed-demo")
+    def seed_demo_command():
+        """Добавить демо-специалистов и их посты (повторный запуск ничего не меняет)."""
+        click.echo(f"Создано демо-пользователей: {seed_demo()}")
+
+    @app.cli.command("seed-synthetic")
+    @click.option("--users", default=1000, show_default=True)
+    @click.option("--conversations", default=2000, show_default=True)
+    @click.option("--messages", default=20, show_default=True, help="Сообщений на диалог.")
+    @click.option("--follows", default=5, show_default=True, help="Подписок на специалистов у каждого ученика.")
+    @click.option("--posts", default=3, show_default=True, help="Постов у каждого специалиста.")
+    @click.option("--seed", default=0, show_default=True, help="Зерно генератора для воспроизводимости.")
+    def seed_synthetic_command(users, conversations, messages, follows, posts, seed):
+        """Сгенерировать синтетических пользователей, диалоги, сообщения и ленты для нагрузочных тестов."""
+        ids = generate(users, conversations, messages, seed, follows=follows, posts=posts)
+        click.echo(f"Создано пользователей: {len(ids)}; пароль: {DEMO_PASSWORD}")
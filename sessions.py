@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+"""Серверные сессии в таблице ``web_session``.
+
+В cookie лежит только случайный токен; в базе — его sha256, данные сессии и
+срок жизни. Сессия читается из базы лениво, при первом обращении к ней, так что
+запросы, не трогающие ``session``, обходятся без лишнего SELECT. Запись — только
+если данные изменились или пора продлить срок.
+
+Срок жизни задаётся на сессию (``set_lifetime``), а не через общий
+``app.permanent_session_lifetime``. ``session.clear()`` выдаёт новый токен —
+вход и выход не переиспользуют старый идентификатор. Просроченные строки
+удаляет фоновый поток раз в ``SESSION_SWEEP_INTERVAL`` секунд и команда
+``flask sessions-sweep``.
+"""
+import datetime
+import hashlib
+import secrets
+import threading
+import time
+
+import click
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+from flask.cli import with_appcontext
+from itsdangerous import BadSignature
+from sqlalchemy import delete, insert, select, update
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+from models import db, WebSession
+
+LIFETIME_KEY = "_lifetime"
+_serializer = TaggedJSONSerializer()
+_table = WebSession.__table__
+
+
+def _digest(token):
+    return hashlib.sha256(token.encode("ascii")).hexdigest()
+
+
+def _now():
+    return datetime.datetime.utcnow()
+
+
+def set_lifetime(session, lifetime):
+    """Срок жизни именно этой сессии (timedelta); по умолчанию — PERMANENT_SESSION_LIFETIME."""
+    session[LIFETIME_KEY] = int(lifetime.total_seconds())
+
+
+def lifetime(app, session):
+    seconds = dict.get(session, LIFETIME_KEY)
+    return datetime.timedelta(seconds=seconds) if seconds else app.permanent_session_lifetime
+
+
+def _expiration_time(app, session):
+    if session.permanent:
+        return datetime.datetime.now(datetime.timezone.utc) + lifetime(app, session)
+    return None
+
+
+class ServerSession(dict, SessionMixin):
+    """dict, который подгружает данные из базы при первом обращении."""
+
+    def __init__(self, token=None, loader=None):
+        super().__init__()
+        self.token = token
+        self.expires_at = None
+        self.loaded = loader is None
+        self.modified = False
+        self.accessed = False
+        self.rotate = False
+        self._loader = loader
+
+    def _load(self):
+        self.accessed = True
+        if not self.loaded:
+            self.loaded = True
+            row = self._loader()
+            if row is None:
+                self.token = None  # истекла или удалена — начнём новую
+            else:
+                data, self.expires_at = row
+                dict.update(self, data)
+
+    def _write(self):
+        self._load()
+        self.modified = True
+
+    # чтение
+    def __getitem__(self, key):
+        self._load(); return dict.__getitem__(self, key)
+
+    def get(self, key, default=None):
+        self._load(); return dict.get(self, key, default)
+
+    def __contains__(self, key):
+        self._load(); return dict.__contains__(self, key)
+
+    def __iter__(self):
+        self._load(); return dict.__iter__(self)
+
+    def __len__(self):
+        self._load(); return dict.__len__(self)
+
+    def __bool__(self):
+        self._load(); return dict.__len__(self) > 0
+
+    def keys(self):
+        self._load(); return dict.keys(self)
+
+    def values(self):
+        self._load(); return dict.values(self)
+
+    def items(self):
+        self._load(); return dict.items(self)
+
+    def copy(self):
+        self._load(); return dict.copy(self)
+
+    # запись
+    def __setitem__(self, key, value):
+        self._write(); dict.__setitem__(self, key, value)
+
+    def __delitem__(self, key):
+        self._write(); dict.__delitem__(self, key)
+
+    def pop(self, key, *default):
+        self._write(); return dict.pop(self, key, *default)
+
+    def popitem(self):
+        self._write(); return dict.popitem(self)
+
+    def setdefault(self, key, default=None):
+        self._write(); return dict.setdefault(self, key, default)
+
+    def update(self, *args, **kwargs):
+        self._write(); dict.update(self, *args, **kwargs)
+
+    def clear(self):
+        self._write()
+        self.rotate = True
+        dict.clear(self)
+
+
+class DbSessionInterface(SessionInterface):
+    def __init__(self, engine):
+        self.engine = engine
+
+    def get_expiration_time(self, app, session):
+        return _expiration_time(app, session)
+
+    def _delete(self, token):
+        with self.engine.begin() as conn:
+            conn.execute(delete(_table).where(_table.c.id == _digest(token)))
+
+    def _loader(self, token):
+        def load():
+            with self.engine.connect() as conn:
+                row = conn.execute(select(_table.c.data, _table.c.expires_at)
+                                   .where(_table.c.id == _digest(token), _table.c.expires_at > _now())).first()
+            return (_serializer.loads(row.data), row.expires_at) if row else None
+        return load
+
+    def open_session(self, app, request):
+        token = request.cookies.get(self.get_cookie_name(app))
+        if not token or len(token) > 128:
+            return ServerSession()
+        return ServerSession(token, self._loader(token))
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+        if session.accessed:
+            response.vary.add("Cookie")
+        if not session.loaded:
+            return  # запрос не трогал сессию
+
+        if not dict.__len__(session):
+            if session.token:
+                self._delete(session.token)
+                response.delete_cookie(name, domain=domain, path=path,
+                                       secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app),
+                                       httponly=self.get_cookie_httponly(app))
+            return
+
+        ttl = lifetime(app, session)
+        expires_at = _now() + ttl
+        if session.rotate and session.token:
+            self._delete(session.token)
+            session.token = None
+        user_id = dict.get(session, "user_id")
+        if session.token is None:
+            session.token = secrets.token_urlsafe(32)
+            with self.engine.begin() as conn:
+                conn.execute(insert(_table).values(id=_digest(session.token), data=_serializer.dumps(dict.copy(session)),
+                                                   user_id=user_id, expires_at=expires_at))
+        elif session.modified:
+            with self.engine.begin() as conn:
+                conn.execute(update(_table).where(_table.c.id == _digest(session.token))
+                             .values(data=_serializer.dumps(dict.copy(session)), user_id=user_id, expires_at=expires_at))
+        elif session.expires_at and expires_at - session.expires_at > ttl * app.config["SESSION_REFRESH_FRACTION"]:
+            # скользящий срок: продлеваем не на каждом запросе, а когда заметно истёк
+            with self.engine.begin() as conn:
+                conn.execute(update(_table).where(_table.c.id == _digest(session.token)).values(expires_at=expires_at))
+        else:
+            return
+
+        response.set_cookie(name, session.token, expires=self.get_expiration_time(app, session),
+                            httponly=self.get_cookie_httponly(app), domain=domain, path=path,
+                            secure=self.get_cookie_secure(app), samesite=self.get_cookie_samesite(app))
+
+
+class CookieSessionInterface(SecureCookieSessionInterface):
+    """Подписанная cookie Flask (SESSION_BACKEND="cookie"), но со сроком из ``set_lifetime``."""
+
+    def open_session(self, app, request):
+        s = self.get_signing_serializer(app)
+        if s is None:
+            return None
+        val = request.cookies.get(self.get_cookie_name(app))
+        if not val:
+            return self.session_class()
+        # Flask проверяет возраст подписи по общему PERMANENT_SESSION_LIFETIME — у нас срок свой у каждой сессии
+        try:
+            data, signed_at = s.loads(val, return_timestamp=True)
+        except BadSignature:
+            return self.session_class()
+        if datetime.datetime.now(datetime.timezone.utc) - signed_at > lifetime(app, data):
+            return self.session_class()
+        return self.session_class(data)
+
+    def get_expiration_time(self, app, session):
+        return _expiration_time(app, session)
+
+
+def sweep(engine):
+    """Удаляет просроченные сессии; возвращает число удалённых."""
+    with engine.begin() as conn:
+        return conn.execute(delete(_table).where(_table.c.expires_at <= _now())).rowcount
+
+
+class _Sweeper:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, app, engine, interval):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, args=(app, engine, interval),
+                                            name="session-sweeper", daemon=True)
+            self._thread.start()
+
+    @staticmethod
+    def _run(app, engine, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                removed = sweep(engine)
+                if removed:
+                    app.logger.info("removed %s expired sessions", removed)
+            except (OperationalError, ProgrammingError):
+                app.logger.exception("session sweep failed")
+
+
+sweeper = _Sweeper()
+
+
+def init_app(app):
+    app.config.setdefault("SESSION_BACKEND", "db")
+    app.config.setdefault("SESSION_SWEEP_INTERVAL", 600)
+    # доля срока жизни, после которой неизменённая сессия продлевается записью в базу
+    app.config.setdefault("SESSION_REFRESH_FRACTION", 0.1)
+    app.cli.add_command(sessions_sweep_command)
+    if app.config["SESSION_BACKEND"] != "db":
+        app.session_interface = CookieSessionInterface()
+        return
+    with app.app_context():
+        engine = db.engine
+    app.session_interface = DbSessionInterface(engine)
+
+    @app.before_request
+    def _start_sweeper():
+        # поток запускаем с первым запросом, а не при импорте — CLI-командам он не нужен
+        if app.config["SESSION_SWEEP_INTERVAL"]:
+            sweeper.start(app, engine, app.config["SESSION_SWEEP_INTERVAL"])
+
+
+@click.command("sessions-sweep")
+@with_appcontext
+def sessions_sweep_command():
+    """Удалить просроченные серверные сессии."""
+    click.echo(f"Удалено сессий: {sweep(db.engine)}")
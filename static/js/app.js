@@ -36,4 +36,80 @@
       if(!menu.contains(evt.target)) close();
     });
   }
-})();
\ No newline at end of file
+
+  const box = document.querySelector('.messages[data-history-url]');
+  if(box){
+    const url = box.dataset.historyUrl;
+    let hasMore = box.dataset.hasMore === '1';
+    let loading = false;
+    const olderLink = box.querySelector('.older-link');
+    if(olderLink) olderLink.remove();
+    const renderMsg = m => {
+      const el = document.createElement('div');
+      el.className = 'msg' + (m.mine ? ' me' : '');
+      el.dataset.id = m.id;
+      const span = document.createElement('span'); span.textContent = m.text;
+      const time = document.createElement('time'); time.textContent = m.time;
+      el.append(span, time);
+      return el;
+    };
+    const loadOlder = ()=>{
+      const first = box.querySelector('.msg[data-id]');
+      if(!hasMore || loading || !first) return;
+      loading = true;
+      fetch(url + '?before_id=' + first.dataset.id, {headers:{'Accept':'application/json'}})
+        .then(r=>r.json())
+        .then(data=>{
+          const height = box.scrollHeight;
+          const frag = document.createDocumentFragment();
+          data.messages.forEach(m=> frag.appendChild(renderMsg(m)));
+          box.insertBefore(frag, first);
+          box.scrollTop += box.scrollHeight - height;
+          hasMore = data.has_more;
+        })
+        .catch(()=>{})
+        .finally(()=>{ loading = false; });
+    };
+    box.addEventListener('scroll', ()=>{ if(box.scrollTop < 40) loadOlder(); });
+
+    const lastId = ()=>{
+      const all = box.querySelectorAll('.msg[data-id]');
+      return all.length ? all[all.length-1].dataset.id : 0;
+    };
+    const appendMsg = m=>{
+      if(box.querySelector('.msg[data-id="'+m.id+'"]')) return;
+      const stick = box.scrollHeight - box.scrollTop - box.clientHeight < 80;
+      box.appendChild(renderMsg(m));
+      if(stick || m.mine) box.scrollTop = box.scrollHeight;
+    };
+    if(window.EventSource && box.dataset.streamUrl){
+      const es = new EventSource(box.dataset.streamUrl + '?after_id=' + lastId());
+      es.onmessage = evt=>{ try{ appendMsg(JSON.parse(evt.data)); }catch(e){} };
+    }else if(box.dataset.pollUrl){
+      const poll = ()=>{
+        fetch(box.dataset.pollUrl + '?after_id=' + lastId(), {headers:{'Accept':'application/json'}})
+          .then(r=> r.ok ? r.json() : Promise.reject(r))
+          .then(data=>{ data.messages.forEach(appendMsg); poll(); })
+          .catch(()=> setTimeout(poll, 5000));
+      };
+      poll();
+    }
+
+    const form = document.querySelector('.chat-box form.send');
+    if(form){
+      form.addEventListener('submit', evt=>{
+        const input = form.querySelector('input[name=text]');
+        if(!input || !input.value.trim()) return;
+        evt.preventDefault();
+        const body = new FormData(form);
+        const text = input.value;
+        input.value = '';
+        fetch(form.action || location.pathname, {method:'POST', body, headers:{'Accept':'application/json'}})
+          .then(r=> r.ok ? r.json() : Promise.reject(r))
+          .then(data=>{ if(data.message) appendMsg(data.message); })
+          // не JSON (например, редирект на вход) или сеть упала — отправляем форму обычным POST с тем же текстом
+          .catch(()=>{ input.value = text; form.submit(); });
+      });
+    }
+  }
+})();
@@ -0,0 +1,181 @@
+# -*- coding: utf-8 -*-
+"""Теги специалистов и учеников и рекомендации по их пересечению.
+
+``SpecialistProfile.keywords`` и ``StudentProfile.looking_for`` режутся по
+запятым на теги (нижний регистр, латиница через ``translit()``) и хранятся в
+обратном индексе ``user_tag(tag_id, kind, user_id)``: kind='offer' — что ведёт
+специалист, kind='seek' — что ищет ученик. Индекс обновляется в том же flush,
+что и профиль. Рекомендации — один GROUP BY по индексу; результат кэшируется
+на ученика в кэше страниц (``page_cache``) и сбрасывается версиями: своей у
+каждого ученика и общей для тегов всех специалистов. С file-бэкендом кэша
+версии общие для всех воркеров.
+"""
+import re
+
+import click
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session, selectinload
+
+from helpers import translit
+from models import db, User, touched_user_ids
+from page_cache import pages
+
+RECOMMEND_LIMIT = 12
+SPLIT_RE = re.compile(r"[,;\n]+")
+NON_WORD_RE = re.compile(r"[^\w+#]+", re.UNICODE)
+TAG_MAX = 64
+OFFERS = ("tags", "offer")  # версия тегов всех специалистов
+
+_enabled = False
+
+DOC_SQL = (
+    'SELECT u.id, sp.keywords, st.looking_for FROM "user" u '
+    'LEFT JOIN specialist_profile sp ON sp.user_id = u.id '
+    'LEFT JOIN student_profile st ON st.user_id = u.id'
+)
+RECOMMEND_SQL = (
+    "SELECT o.user_id, COUNT(*) AS score, u.follower_count "
+    "FROM user_tag s JOIN user_tag o ON o.tag_id = s.tag_id AND o.kind = 'offer' "
+    'JOIN "user" u ON u.id = o.user_id '
+    "WHERE s.user_id = :uid AND s.kind = 'seek' AND o.user_id != :uid "
+    "GROUP BY o.user_id, u.follower_count "
+    "ORDER BY score DESC, u.follower_count DESC, o.user_id DESC LIMIT :limit"
+)
+
+
+def parse_tags(s):
+    """'Математика, ЕГЭ;  python' -> ['matematika', 'ege', 'python'] без повторов."""
+    tags = []
+    for part in SPLIT_RE.split(s or ""):
+        tag = NON_WORD_RE.sub(" ", translit(part)).strip()[:TAG_MAX]
+        if tag and tag not in tags:
+            tags.append(tag)
+    return tags
+
+
+def _tag_ids(conn, names):
+    if not names:
+        return {}
+    select = text("SELECT name, id FROM tag WHERE name IN :names").bindparams(bindparam("names", expanding=True))
+    found = dict(conn.execute(select, {"names": list(names)}).fetchall())
+    missing = [{"name": n} for n in names if n not in found]
+    if missing:
+        conn.execute(text("INSERT INTO tag (name) VALUES (:name)"), missing)
+        found = dict(conn.execute(select, {"names": list(names)}).fetchall())
+    return found
+
+
+def reindex(conn, user_ids=None):
+    """Перестраивает теги ``user_ids`` (или всех). Возвращает (изменились ли offer-теги, id учеников с новыми seek-тегами)."""
+    if user_ids is None:
+        old = set(conn.execute(text("SELECT user_id, kind, tag_id FROM user_tag")).fetchall())
+        rows = conn.execute(text(DOC_SQL)).fetchall()
+    else:
+        ids = list(user_ids)
+        if not ids:
+            return False, set()
+        old = set(conn.execute(text("SELECT user_id, kind, tag_id FROM user_tag WHERE user_id IN :ids")
+                               .bindparams(bindparam("ids", expanding=True)), {"ids": ids}).fetchall())
+        rows = conn.execute(text(DOC_SQL + " WHERE u.id IN :ids").bindparams(bindparam("ids", expanding=True)),
+                            {"ids": ids}).fetchall()
+    wanted = [(uid, kind, name) for uid, keywords, looking_for in rows
+              for kind, source in (("offer", keywords), ("seek", looking_for))
+              for name in parse_tags(source)]
+    tag_ids = _tag_ids(conn, {name for _, _, name in wanted})
+    new = {(uid, kind, tag_ids[name]) for uid, kind, name in wanted}
+    if new == old:
+        return False, set()
+    gone, added = old - new, new - old
+    if gone:
+        conn.execute(text("DELETE FROM user_tag WHERE user_id = :u AND kind = :k AND tag_id = :t"),
+                     [{"u": u, "k": k, "t": t} for u, k, t in gone])
+    if added:
+        conn.execute(text("INSERT INTO user_tag (user_id, kind, tag_id) VALUES (:u, :k, :t)"),
+                     [{"u": u, "k": k, "t": t} for u, k, t in added])
+    changed = gone | added
+    return any(k == "offer" for _, k, _ in changed), {u for u, k, _ in changed if k == "seek"}
+
+
+def create_index(conn):
+    """Заполняет индекс тегов по всем профилям (вызывается миграцией)."""
+    reindex(conn)
+
+
+def refresh(user_ids=None):
+    """Переиндексирует теги пользователей, записанных в обход ORM flush (пакетный INSERT)."""
+    if _enabled:
+        _remember(db.session, *reindex(db.session.connection(), user_ids))
+
+
+# ---------- Синхронизация и инвалидация ----------
+def _remember(session, offers_changed, students):
+    pending = session.info.setdefault("tags_changed", [False, set()])
+    pending[0] = pending[0] or offers_changed
+    pending[1] |= students
+
+
+@event.listens_for(Session, "after_flush")
+def _sync_tags(session, flush_context):
+    if not _enabled:
+        return  # схема ещё не мигрирована
+    ids = touched_user_ids(session)
+    if ids:
+        _remember(session, *reindex(session.connection(), ids))
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate(session):
+    # кэш сбрасываем только после коммита, иначе параллельный запрос закэширует старые данные
+    pending = session.info.pop("tags_changed", None)
+    if not pending:
+        return
+    offers_changed, students = pending
+    if offers_changed:
+        pages.bump(*OFFERS)
+    for uid in students:
+        pages.bump("tags", uid)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget(session):
+    session.info.pop("tags_changed", None)
+
+
+# ---------- Рекомендации ----------
+def recommended_ids(student_id, limit=RECOMMEND_LIMIT):
+    """[(id специалиста, число общих тегов)] по убыванию релевантности."""
+    if not _enabled:
+        return []
+    ranked = pages.value("recommendations", student_id, (OFFERS, ("tags", student_id)), lambda: [
+        (uid, score) for uid, score, _ in db.session.execute(
+            text(RECOMMEND_SQL), {"uid": student_id, "limit": RECOMMEND_LIMIT})])
+    return ranked[:limit]
+
+
+def recommend(student_id, limit=RECOMMEND_LIMIT):
+    """Специалисты для ученика вместе с профилями: [(User, score)]."""
+    ranked = recommended_ids(student_id, limit)
+    if not ranked:
+        return []
+    users = (User.query.options(selectinload(User.specialist))
+             .filter(User.id.in_([uid for uid, _ in ranked])).all())
+    by_id = {u.id: u for u in users}
+    return [(by_id[uid], score) for uid, score in ranked if uid in by_id]
+
+
+def init_app(app):
+    global _enabled
+    # таблицы тегов создаёт миграция 7; без неё (AUTO_MIGRATE=False) индекс не трогаем
+    with app.app_context():
+        _enabled = inspect(db.engine).has_table("user_tag")
+
+    @app.cli.command("reindex-tags")
+    def reindex_tags_command():
+        """Полностью перестроить индекс тегов и сбросить кэш рекомендаций."""
+        if not _enabled:
+            click.echo("Таблиц тегов нет — выполните `flask db-upgrade`.")
+            return
+        with db.engine.begin() as conn:
+            reindex(conn)
+        pages.bump(*OFFERS)
+        click.echo("Индекс тегов перестроен.")